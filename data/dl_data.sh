@@ -17,7 +17,8 @@ DATA_LIST=(
 	## Also available:
 	# - The *full* final corpus (2.2GB) (FULL_DATASET)
 	# "processed/frwikisource-full.parquet"
-	# - The raw output from `make extract_data` (RAW_DATASET)
+	# - The raw, uncleaned dataset (RAW_DATASET): the page table from `make make_raw_dataset` (i.e., fouille/ingest.py),
+	#   run through `make extract_data`, w/ the categories of Page: pages restored by `make data`
 	# "interim/frwikisource-current.parquet"
 	# - The output from extract_gold_classes in fouille/dataset.py (`make data`) (CLEAN_DATASET)
 	# "interim/frwikisource-cleaned.parquet"
@@ -1,35 +1,65 @@
 #!/usr/bin/env python3
 #
 # Initial data extraction pass.
+# Reads either the page table from fouille/ingest.py (default), or the legacy marshalled dicts from xmltodict.
+# Emits two tables: the text rows, and the categories of each book (i.e., of the Page: pages that make it up),
+# which fouille/dataset.py joins back together.
 # NOTE: Beware, this will take *a while* (between 2 and 3 hours, significantly more with verbose logging),
-#       and a good chunk of RAM (a tad less than make_dataset.sh, but >16GB nonetheless).
+#       unless you spread the parsing over multiple cores with --workers.
+#       Extracted pages are streamed to disk, so memory usage is bounded by the row group size.
+#       Progress is checkpointed regularly, so a crashed (or preempted) run can pick up where it left off w/ --resume
+#       (provided the dump & the engine are still the same).
+#       Every run leaves a manifest of the pages it saw behind, so that the next dump can be processed w/ --incremental,
+#       which only parses new or modified pages, and carries everything else forward from the previous run.
+#       Pass --stats-path to find out where the time goes (rejection counters, per-stage timings & throughput).
+#       Input is decompressed & decoded on a background thread, so that overlaps with the parsing.
+#       Legacy dicts packed in frames (c.f., fouille/frames.py) are seekable, so --frames can pick a slice of the dump.
+#       Slices get their own tables (e.g., frwikisource-current.frames-0-1000.text.parquet), and leave no manifest behind.
 #
 
-from collections import defaultdict
-from io import RawIOBase
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from io import BufferedReader, RawIOBase
+import json
 import marshal
+import multiprocessing
 from pathlib import Path
+from queue import Full, Queue
 import re
+import shutil
+import threading
+from time import perf_counter
 from typing import Iterator
 
 from loguru import logger
-import numpy as np
-import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 from rich.console import Console
 from rich.pretty import pprint
-import rich.progress
-from rich.progress import track
+from rich.progress import Progress, track
 from rich.text import Text
+import typer
 import wikitextparser as wtp
 from wikitextparser._wikitext import WikiText
 import zstandard as zstd
 
-# Enable CoW in Pandas
-pd.options.mode.copy_on_write = True
+from fouille import frames as framed
+from fouille.instrument import Stats, dump_json
+from fouille.wikitext import CATEGORY_RE, PAGES_INDEX_RE, PAGES_RE, parse_fast, parse_wtp
 
 BASE_DIR = Path(__file__).parent.resolve()
+PAGE_TABLE_PATH = BASE_DIR / "raw" / "frwikisource-current.pages.parquet"
 PAGE_ARTICLES_PATH = BASE_DIR / "raw" / "frwikisource-current.dicts.zst"
-RAW_PARQUET_PATH = BASE_DIR / "interim" / "frwikisource-current.parquet"
+# Text rows, and book categories (c.f., restore_categories in fouille/dataset.py)
+RAW_TEXT_PATH = BASE_DIR / "interim" / "frwikisource-current.text.parquet"
+RAW_BOOKS_PATH = BASE_DIR / "interim" / "frwikisource-current.books.parquet"
+# Revision & contributions of every relevant page of the last run (c.f., --incremental)
+MANIFEST_PATH = BASE_DIR / "interim" / "frwikisource-current.manifest.parquet"
+# Extracted pages, before they're stitched together (along with checkpoints)
+STAGING_DIR = BASE_DIR / "interim" / "frwikisource-current.staging"
+CHECKPOINT_NAME = "checkpoint.json"
 
 # c.f., the namespaces element at the top of the XML dump
 WS_FR_NAMESPACES = set(
@@ -75,18 +105,91 @@ WS_FR_NAMESPACES = set(
 	}
 )
 
-PQ_RE = re.compile(r"<pagequality [^>]+/>")
-PQ_LEVEL_RE = re.compile(r"level=\"(\d)\"")
-PAGES_RE = re.compile(r"<pages [^>]+/>")
-PAGES_INDEX_RE = re.compile(r"index=\"([^\"]+)\"")
 # NOTE: ranges are not uncommon (and can span a few centuries :/), so allow that...
 PUBYEAR_RE = re.compile(r"(\d{4})(-\d{4})?")
+# Cheap approximations of what we'd otherwise have to ask wikitextparser about (c.f., classify_page)
+TEXTQUALITY_RE = re.compile(r"\{\{textquality(?=[|}])", re.IGNORECASE)
+PAGE_TEMPLATE_RE = re.compile(r"\{\{page(?=[|}])(?:\|(?:[^|}=]*=)?([^|}]*))?", re.IGNORECASE)
+COMMENT_RE = re.compile(r"<!--.*?-->", re.DOTALL)
+
+# Wikitext parsers for text pages (c.f., fouille/wikitext.py)
+ENGINES = {
+	"fast": parse_fast,
+	"wtp": parse_wtp,
+}
+
+# Page routes (c.f., classify_page)
+ROUTE_LIVRE = "livre"
+ROUTE_PAGES_ELEMENT = "pages-element"
+ROUTE_PAGE_TEMPLATE = "page-template"
+ROUTE_TEXT = "text"
+# Same revision as in the previous run's manifest (c.f., --incremental)
+ROUTE_UNCHANGED = "unchanged"
 
 # NOTE: That's not enough to get rid of most of the ToC pages...
 PAGE_LEN_THRESHOLD = 384
 
-# Pages under the Page: namespace do *not* have categories, so we try to stitch things back together...
-BOOK_CATEGORIES: dict[str, set[str]] = defaultdict(set)
+# Rejection counters, stage timings, etc. (c.f., --stats-path)
+STATS = Stats()
+
+# Pages per work unit sent to the worker processes (c.f., --workers)
+CHUNK_SIZE = 256
+# Extracted pages per parquet row group (this is what bounds memory usage)
+ROW_GROUP_SIZE = 8192
+# Input pages between checkpoints (c.f., --resume)
+CHECKPOINT_EVERY = 100_000
+# Pages per batch handed over by the input thread, and max amount of batches in flight (c.f., prefetch)
+PREFETCH_BATCH_SIZE = 1024
+PREFETCH_DEPTH = 8
+# Reads against the compressed legacy input (and its decompressed buffer)
+READ_SIZE = 4 * 1024 * 1024
+
+ROWS_SCHEMA = pa.schema(
+	[
+		("title", pa.string()),
+		("categories", pa.list_(pa.string())),
+		("quality", pa.uint8()),
+		("text", pa.string()),
+	]
+)
+
+# One record per relevant page, so an incremental run can tell what it needs to re-parse,
+# and carry forward the rows of everything else.
+# NOTE: Pages under the Page: namespace do *not* have categories, so we try to stitch things back together:
+#       book_categories holds the categories a page contributes to books (c.f., write_books).
+MANIFEST_SCHEMA = pa.schema(
+	[
+		("title", pa.string()),
+		("revision_id", pa.int64()),
+		("sha1", pa.string()),
+		# NOTE: null in the staging manifest for pages carried forward from the previous run
+		("extracted", pa.bool_()),
+		(
+			"book_categories",
+			pa.list_(pa.struct([("book_title", pa.string()), ("categories", pa.list_(pa.string()))])),
+		),
+	]
+)
+
+
+app = typer.Typer()
+
+
+def flatten_page(page: dict) -> dict:
+	"""
+	Flatten an xmltodict page dictionary into the same record layout as the fouille.ingest page table
+	"""
+
+	revision = page.get("revision", {})
+	return {
+		"title": page.get("title"),
+		"ns": int(page["ns"]) if "ns" in page else None,
+		"model": revision.get("model"),
+		"format": revision.get("format"),
+		"text": revision.get("text", {}).get("#text"),
+		"revision_id": int(revision["id"]) if "id" in revision else None,
+		"sha1": revision.get("sha1"),
+	}
 
 
 def page_gen(f: RawIOBase) -> Iterator[dict]:
@@ -96,12 +199,156 @@ def page_gen(f: RawIOBase) -> Iterator[dict]:
 
 	try:
 		while True:
-			_, page = marshal.load(f)
+			with STATS.timed("unmarshal"):
+				_, page = marshal.load(f)
+				page = flatten_page(page)
 			yield page
 	except EOFError:
 		pass
 
 
+def marshal_batches(input_path: Path, skip: int = 0) -> Iterator[tuple[list[dict], int]]:
+	"""
+	Read page records from the legacy marshalled dicts, PREFETCH_BATCH_SIZE pages at a time,
+	starting after the first skip pages (generator).
+	Each batch comes with the amount of compressed bytes read so far.
+	"""
+
+	with open(input_path, "rb") as fh:
+		# NOTE: Framed dumps are a sequence of zstd frames (c.f., frame_batches for the seekable way to read those)
+		reader = zstd.ZstdDecompressor().stream_reader(fh, read_size=READ_SIZE, read_across_frames=True)
+		if STATS.enabled:
+			reader = TimedReader(reader)
+		# NOTE: marshal.load does *lots* of tiny reads, so give it a large decompressed buffer to chew on
+		f = BufferedReader(reader, buffer_size=READ_SIZE)
+
+		batch = []
+		for page in page_gen(f):
+			# NOTE: We can't seek in the stream, but at least we don't have to *parse* the pages we skip
+			if skip:
+				skip -= 1
+				continue
+
+			batch.append(page)
+			if len(batch) >= PREFETCH_BATCH_SIZE:
+				yield batch, fh.tell()
+				batch = []
+		yield batch, fh.tell()
+
+
+def frame_batches(input_path: Path, frames: list[dict], skip: int = 0) -> Iterator[tuple[list[dict], int]]:
+	"""
+	Read page records from a framed dump (c.f., fouille/frames.py), one frame at a time,
+	starting after the first skip pages of the given frames (generator).
+	Each batch comes with the amount of compressed bytes read so far.
+	"""
+
+	position = 0
+	# Jump straight to the frame holding the first page we want
+	while frames and skip >= frames[0]["pages"]:
+		skip -= frames[0]["pages"]
+		position += frames[0]["size"]
+		frames = frames[1:]
+
+	dctx = zstd.ZstdDecompressor()
+	with open(input_path, "rb") as fh:
+		for frame in frames:
+			with STATS.timed("decompress"):
+				data = dctx.decompress(framed.read_frame(fh, frame))
+			position += frame["size"]
+			STATS.count("bytes", len(data))
+
+			with STATS.timed("unmarshal"):
+				pages = [flatten_page(page) for _, page in framed.frame_items(data)]
+			yield pages[skip:], position
+			skip = 0
+
+
+def table_batches(pf: pq.ParquetFile, skip: int = 0) -> Iterator[tuple[list[dict], int]]:
+	"""
+	Read page records from the fouille.ingest page table, one batch at a time,
+	starting after the first skip rows (generator).
+	Each batch comes with the amount of rows read so far.
+	"""
+
+	# Skip whole row groups w/o reading them
+	first = 0
+	while first < pf.num_row_groups and skip >= pf.metadata.row_group(first).num_rows:
+		skip -= pf.metadata.row_group(first).num_rows
+		first += 1
+	row_groups = list(range(first, pf.num_row_groups))
+	position = sum(pf.metadata.row_group(i).num_rows for i in range(first))
+
+	batches = pf.iter_batches(
+		batch_size=PREFETCH_BATCH_SIZE,
+		row_groups=row_groups,
+		columns=["title", "format", "text", "revision_id", "sha1"],
+	)
+	while True:
+		# NOTE: That's where the zstd decompression (& parquet decoding) happens
+		with STATS.timed("decompress"):
+			batch = next(batches, None)
+		if batch is None:
+			break
+
+		position += batch.num_rows
+		if skip:
+			batch = batch.slice(skip)
+			skip = 0
+		STATS.count("bytes", batch.nbytes)
+		with STATS.timed("unmarshal"):
+			pages = batch.to_pylist()
+		yield pages, position
+
+
+def prefetch(batches: Iterator[tuple[list[dict], int]], depth: int = PREFETCH_DEPTH) -> Iterator[tuple[list[dict], int]]:
+	"""
+	Run a batch generator on a background thread, and hand its batches over through a bounded queue (generator).
+	NOTE: Both zstd & parquet decompression release the GIL, so that actually overlaps with the parsing.
+	"""
+
+	queue = Queue(maxsize=depth)
+	stop = threading.Event()
+	done = object()
+
+	def put(item: object) -> bool:
+		# NOTE: Don't block forever on a consumer that's gone away (e.g., on errors)
+		while not stop.is_set():
+			try:
+				queue.put(item, timeout=0.1)
+				return True
+			except Full:
+				pass
+		return False
+
+	def produce() -> None:
+		try:
+			for batch in batches:
+				if not put(batch):
+					return
+			put(done)
+		except BaseException as e:
+			put(e)
+		finally:
+			batches.close()
+
+	thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+	thread.start()
+	try:
+		while True:
+			# NOTE: Ideally, the consumer never waits (c.f., --stats-path)
+			with STATS.timed("prefetch_wait"):
+				item = queue.get()
+			if item is done:
+				break
+			if isinstance(item, BaseException):
+				raise item
+			yield item
+	finally:
+		stop.set()
+		thread.join()
+
+
 def page_extract(page: dict) -> dict | None:
 	"""
 	Extract relevant fields from a given page.
@@ -110,45 +357,94 @@ def page_extract(page: dict) -> dict | None:
 
 	# pprint(page)
 
-	if "title" not in page:
+	if not page["title"]:
 		# e.g., First item
 		return None
 
 	title = page["title"]
-	logger.opt(colors=True).info(f"Processing <blue>{title}</blue>")
+	# NOTE: Let loguru do the formatting, so we don't pay for it when the message is filtered out
+	logger.opt(colors=True).info("Processing <blue>{}</blue>", title)
 
 	# Skip every page w/ a namespace
-	for ns in WS_FR_NAMESPACES:
-		if title.startswith(ns):
-			logger.warning("Unwanted namespace")
-			return None
+	ns, sep, _ = title.partition(":")
+	if sep and ns + sep in WS_FR_NAMESPACES:
+		logger.warning("Unwanted namespace")
+		STATS.count("rejected.namespace")
+		return None
 
-	if page["revision"]["format"] != "text/x-wiki":
+	if page["format"] != "text/x-wiki":
 		# e.g., CSS
 		logger.warning("Not a wikitext page")
+		STATS.count("rejected.non_wikitext")
 		return None
 
-	if "#text" not in page["revision"]["text"]:
+	text = page["text"]
+	if text is None:
 		# e.g., :?
 		logger.warning("No text")
+		STATS.count("rejected.no_text")
 		return None
 
-	text = page["revision"]["text"]["#text"]
 	# Skip redirs
 	if text.startswith("#REDIRECTION"):
 		logger.warning("Is a redirection")
+		STATS.count("rejected.redirect")
 		return None
 
-	# Pull title & raw text
+	route = classify_page(title, text)
+	if not route:
+		return None
+	STATS.count(f"routed.{route}")
+
+	# Pull title & raw text (and revision info for the manifest)
 	data = {
 		"title": title,
 		"text": text,
+		"route": route,
+		"revision_id": page["revision_id"],
+		"sha1": page["sha1"],
 	}
 
 	return data
 
 
-def parse_livre(parsed: WikiText, book_title: str) -> None:
+def classify_page(title: str, text: str) -> str | None:
+	"""
+	Cheaply decide how a page needs to be handled, so that only pages that will actually end up as text rows
+	go through a full parse. Returns None if the page can be skipped outright.
+	NOTE: This mirrors the checks done in parse_page, in the same order.
+	"""
+
+	# NOTE: wikitextparser ignores whatever is commented out (e.g., a disabled Page template), so do the same
+	if "<!--" in text:
+		text = COMMENT_RE.sub("", text)
+
+	# Proofread-index pages (we only care about the publication date)
+	if title.startswith("Livre:"):
+		return ROUTE_LIVRE
+
+	# Pages that are dynamically generated from single djvu pages only contribute categories
+	if "<pages " in text:
+		return ROUTE_PAGES_ELEMENT
+	if PAGE_TEMPLATE_RE.search(text):
+		return ROUTE_PAGE_TEMPLATE
+
+	# We'd drop pages w/o a known quality anyway
+	if "<pagequality " not in text and not TEXTQUALITY_RE.search(text):
+		logger.warning("No TextQuality")
+		STATS.count("rejected.no_quality")
+		return None
+
+	# Markup only ever makes the plain text *shorter*
+	if len(text) < PAGE_LEN_THRESHOLD:
+		logger.warning("Is below the length threshold")
+		STATS.count("rejected.below_threshold")
+		return None
+
+	return ROUTE_TEXT
+
+
+def parse_livre(parsed: WikiText, book_title: str, book_categories: dict[str, set[str]]) -> None:
 	"""
 	Extract publication year info from a Livre: page
 	"""
@@ -167,87 +463,82 @@ def parse_livre(parsed: WikiText, book_title: str) -> None:
 			# Extract numerical values only...
 			m = PUBYEAR_RE.search(argument.value)
 			if m:
-				logger.opt(colors=True).info(f"Pulled a publication date from <red>{book_title}</red>")
-				BOOK_CATEGORIES[book_title].add(m.group(0))
+				logger.opt(colors=True).info("Pulled a publication date from <red>{}</red>", book_title)
+				book_categories[book_title].add(m.group(0))
 
 
-def parse_page(data: dict) -> dict:
+def parse_embed(data: dict, book_categories: dict[str, set[str]]) -> bool:
 	"""
-	Main data wrangling logic for relevant pages
+	Pull categories from pages that dynamically embed Page: pages (via the pages element or the Page template).
+	These don't have any text of their own, so there's no need for a full parse.
+	Returns False if there's no Page template after all, in which case the page should go through the text route.
 	"""
 
-	parsed = wtp.parse(data["text"])
 	title = data["title"]
+	# NOTE: wikitextparser ignores links in comments, so do the same
+	text = COMMENT_RE.sub("", data["text"])
 
-	# Convert to plain text
-	# NOTE: This may be a *tad* aggressive... ;'(
-	text = parsed.plain_text()
-
-	# Some page have actual content between comment tags... >_<"
-	# for comment in parsed.comments:
-	# 	pprint(comment)
-	# NOTE: Still includes some syntax elements (markdown-esque, as well as the link titles, without the special markup)
-
-	categories = set()
-	# Check links for Categories
-	for link in parsed.wikilinks:
-		elts = link.title.split(":")
-		if len(elts) < 2:
-			continue
+	if data["route"] == ROUTE_PAGES_ELEMENT:
+		logger.warning("Embeds content via the pages element")
+		# NOTE: Try to use the actual index value, which should match the Page: pages...
+		m = PAGES_RE.search(text)
+		if not m:
+			return True
+		m = PAGES_INDEX_RE.search(m.group(0))
+		if not m:
+			return True
+		book_title = m.group(1)
+		# Avoid purely numeric titles (this should be much less prone to bogus entries than Page templates)
+	else:
+		m = PAGE_TEMPLATE_RE.search(text)
+		if not m:
+			# NOTE: classify_page strips comments too, so this shouldn't happen, but a text page beats a crash
+			STATS.count("routed.embed_fallback")
+			return False
+		logger.warning("Embeds content via the Page template")
+		book_title = m.group(1) or ""
+		# Avoid purely numeric titles (in particular, there's a bogus {{Page:24}} somewhere...)
 
-		key, value = elts[0], elts[1]
-		ci_key = key.lower()
-		if ci_key == "catégorie" or ci_key == "category":
-			value = value.strip()
-			if value:
-				categories.add(value.strip())
+	if not book_title or book_title.isnumeric():
+		book_title = title
+	logger.opt(colors=True).info("From <red>{}</red>", book_title)
 
-		# Drop the links from the actual text. This is obviously particularly critical for the categories, lol ;).
-		text = text.replace(f"{key}:{value}", "")
-		# NOTE: In the same vein, some front-matter or ToC may include dates, that might be a problem for us...
-		# NOTE: So can the title, for that matter...
+	categories = book_categories[book_title]
+	for m in CATEGORY_RE.finditer(text):
+		value = m.group(1).strip()
+		if value:
+			categories.add(value)
+	return True
 
-	# Handle proofread-index pages (to pickup the publication date)
-	if title.startswith("Livre:"):
-		return parse_livre(parsed, title[6:])
 
-	# Skip pages that are dynamically generated from single djvu pages...
-	if "<pages " in parsed.string:
-		logger.warning("Embeds content via the pages element")
-		# NOTE: Try to use the actual index value, which should match the Page: pages...
-		m = PAGES_RE.search(parsed.string)
-		if m:
-			m = PAGES_INDEX_RE.search(m.group(0))
-			if m:
-				book_title = m.group(1)
+def parse_page(data: dict, book_categories: dict[str, set[str]], engine: str) -> dict | None:
+	"""
+	Main data wrangling logic for relevant pages, dispatched on the route picked by classify_page.
+	Categories pulled from pages that embed Page: pages are accumulated in book_categories.
+	engine selects the wikitext parser used for text pages (c.f., ENGINES).
+	"""
 
-				# Avoid purely numeric titles (this should be much less prone to bogus entries than Page templates)
-				if book_title.isnumeric():
-					book_title = title
-				logger.opt(colors=True).info(f"From <red>{book_title}</red>")
-				BOOK_CATEGORIES[book_title] |= categories
+	route = data["route"]
+	if route == ROUTE_LIVRE:
+		# Handle proofread-index pages (to pickup the publication date)
+		return parse_livre(wtp.parse(data["text"]), data["title"][6:], book_categories)
+	if route != ROUTE_TEXT and parse_embed(data, book_categories):
 		return None
 
+	# Convert to plain text, and pick up categories & quality info along the way
+	# NOTE: The wtp engine may be a *tad* aggressive... ;'(
+	#       The fast engine is a single pass converter that's been validated against it (c.f., fouille/wikitext.py).
+	with STATS.timed("plain_text"):
+		parsed = ENGINES[engine](data["text"])
+	text = parsed.text
+	categories = parsed.categories
+	# NOTE: In the same vein, some front-matter or ToC may include dates, that might be a problem for us...
+	# NOTE: So can the title, for that matter...
+
 	# Check templates for TextQuality
 	quality = None
-	for template in parsed.templates:
-		key = template.name.lower()
-		# Much like the HTML variant above, skip pages that use a template to dynamically embded single djvu pages...
-		if key == "page":
-			logger.warning("Embeds content via the Page template")
-			book_title = template.arguments[0].value
-
-			# Avoid purely numeric titles (in particular, there's a bogus {{Page:24}} somewhere...)
-			if book_title.isnumeric():
-				book_title = title
-			logger.opt(colors=True).info(f"From <red>{book_title}</red>")
-			BOOK_CATEGORIES[book_title] |= categories
-			return None
-
-		if key != "textquality":
-			continue
-
-		value = template.arguments[0].value
+	value = parsed.text_quality
+	if value is not None:
 		# c.f., https://fr.wikisource.org/wiki/Aide:Qualit%C3%A9_des_textes
 		if value == "Textes validés":
 			quality = 100
@@ -258,6 +549,7 @@ def parse_page(data: dict) -> dict:
 	# Skip smol pages
 	if len(text) < PAGE_LEN_THRESHOLD:
 		logger.warning("Is below the length threshold")
+		STATS.count("rejected.below_threshold")
 		return None
 
 	# Check the pagequality element, too...
@@ -265,27 +557,17 @@ def parse_page(data: dict) -> dict:
 	#       (We don't currently save that field in page_extract, though ;)).
 	#       You should only find proofread-page models in the Page namespace, anyway.
 	#       (Conversely, proofread-index models are in the Livre namespace, which we skip already).
-	if not quality:
-		if "<pagequality " in parsed.string:
-			m = PQ_RE.search(parsed.string)
-			if m:
-				m = PQ_LEVEL_RE.search(m.group(0))
-				if m:
-					# Scale is 0 to 4, make it match TextQuality
-					quality = int(m.group(1)) * 25
+	if not quality and parsed.page_quality is not None:
+		# Scale is 0 to 4, make it match TextQuality
+		quality = parsed.page_quality * 25
 
 	# Skip unknown quality (because it's often disambiguation pages)
 	if not quality:
 		logger.warning("Low TextQuality")
+		STATS.count("rejected.low_quality")
 		return None
 
-	# Try to restore categories on Page: pages...
-	if title.startswith("Page:"):
-		for book_title, cats in BOOK_CATEGORIES.items():
-			if title[5:].startswith(book_title):
-				logger.opt(colors=True).info(f"Restored categories from <cyan>{book_title}</cyan>")
-				categories |= cats
-				break
+	# NOTE: Categories are restored on Page: pages later on, once we've seen every book (c.f., fouille/dataset.py).
 
 	# Warn if we found no categories...
 	if not bool(categories):
@@ -300,77 +582,584 @@ def parse_page(data: dict) -> dict:
 	return page
 
 
-def main() -> None:
+def parse_chunk(chunk: list[dict], engine: str) -> tuple[list[dict], list[dict]]:
 	"""
-	Main CLI entry-point
+	Worker entry-point: parse a chunk of pages.
+	Returns the extracted pages, and a manifest record for every page of the chunk,
+	which includes its contributions to book categories.
 	"""
 
 	pages = []
-	with rich.progress.open(PAGE_ARTICLES_PATH, "rb", console=console) as fh:
-		dctx = zstd.ZstdDecompressor()
-		with dctx.stream_reader(fh) as reader:
-			for page in page_gen(reader):
+	records = []
+	for data in chunk:
+		record = {
+			"title": data["title"],
+			"revision_id": data["revision_id"],
+			"sha1": data["sha1"],
+			"extracted": None,
+			"book_categories": None,
+		}
+		records.append(record)
+		if data["route"] == ROUTE_UNCHANGED:
+			continue
+
+		book_categories = defaultdict(set)
+		with STATS.timed("parse"):
+			page = parse_page(data, book_categories, engine)
+		record["extracted"] = page is not None
+		if page:
+			pages.append(page)
+		record["book_categories"] = [
+			{"book_title": book_title, "categories": sorted(cats)} for book_title, cats in book_categories.items()
+		]
+	return pages, records
+
+
+def chunk_gen(
+	pages: Iterator[dict], size: int, pages_read: int = 0, previous: dict[str, tuple] | None = None
+) -> Iterator[tuple[int, list[dict]]]:
+	"""
+	Group relevant pages in chunks of (at most) size pages (generator).
+	Each chunk comes with the amount of input pages read so far, so we know where to resume from.
+	Pages whose revision matches the one in previous (c.f., load_manifest) are routed as unchanged.
+	"""
+
+	chunk = []
+	for page in pages:
+		pages_read += 1
+		STATS.count("pages")
+		if previous is not None and previous.get(page["title"]) == (page["revision_id"], page["sha1"]):
+			# NOTE: It was relevant last time, and it hasn't changed since, so there's nothing to parse
+			data = {
+				"title": page["title"],
+				"route": ROUTE_UNCHANGED,
+				"revision_id": page["revision_id"],
+				"sha1": page["sha1"],
+			}
+			STATS.count(f"routed.{ROUTE_UNCHANGED}")
+		else:
+			# NOTE: page_extract is cheap, so we keep it here to avoid shipping irrelevant pages to the workers
+			with STATS.timed("route"):
 				data = page_extract(page)
-				if not data:
-					# pprint(page)
-					continue
+		if data:
+			chunk.append(data)
+		if len(chunk) >= size:
+			yield pages_read, chunk
+			chunk = []
+	yield pages_read, chunk
 
-				# pprint(page)
-				# pprint(data)
-				page = parse_page(data)
-				if page:
-					# pprint(page)
-					pages.append(page)
-					logger.opt(colors=True).info(f"Extracted <green>{page['title']}</green>")
-	logger.info(f"Extracted {len(pages)} pages")
 
-	# NOTE: Given that we cannot guarantee the order in which we parse pages,
-	#       we need to do another pass to restore categories from BOOK_CATEGORIES...
-	#       i.e., We're likely to have seen most of the Page: pages *before*
-	#       we saw the page that embeds them from which we could pull categories...
-	logger.info("Restoring categories on Page: pages...")
-	for page in track(pages, console=console, description="Processing..."):
-		title = page["title"]
-		if not title.startswith("Page:"):
-			continue
+def init_worker(stats: bool) -> None:
+	"""
+	Worker initializer: start from a clean slate, stats-wise (c.f., parse_chunk_worker)
+	"""
 
-		categories = page["categories"]
-		for book_title, cats in BOOK_CATEGORIES.items():
-			if title[5:].startswith(book_title):
-				logger.opt(colors=True).info(
-					f"Restored categories to <green>{title}</green> from <cyan>{book_title}</cyan>"
-				)
-				categories |= cats
-				break
+	STATS.enabled = stats
+	STATS.take()
 
-	# Convert to a DataFrame
-	logger.info("Building a dataframe...")
-	df = pd.DataFrame(pages)
 
-	# Use appropriate datatypes...
-	# NOTE: We miiiight actually want to keep everything except quality as native Python objects, we'll see...
-	df = df.astype(
-		{
-			"title": "string",
-			"quality": np.uint8,  # "category",
-			"text": "string",
-		}
+def parse_chunk_worker(chunk: list[dict], engine: str) -> tuple[list[dict], list[dict], dict]:
+	"""
+	parse_chunk, plus whatever the worker's STATS gathered while parsing that chunk
+	"""
+
+	return *parse_chunk(chunk, engine), STATS.take()
+
+
+def parallel_parse(
+	chunks: Iterator[tuple[int, list[dict]]], workers: int, engine: str
+) -> Iterator[tuple[int, list[dict], list[dict]]]:
+	"""
+	Fan chunks out to a pool of worker processes, and yield the extracted pages in input order (generator),
+	so the results match a serial run.
+	"""
+
+	# NOTE: By the time the first chunk is submitted, the prefetch (& progress) threads are running,
+	#       and forking a threaded process may deadlock the workers (on locks held by pyarrow, zstd, ...),
+	#       so workers are forked from a clean server process instead
+	with ProcessPoolExecutor(
+		max_workers=workers,
+		mp_context=multiprocessing.get_context("forkserver"),
+		initializer=init_worker,
+		initargs=(STATS.enabled,),
+	) as executor:
+		# NOTE: Keep a bounded amount of chunks in flight, so we don't slurp the whole input in memory
+		pending = deque()
+		for pages_read, chunk in chunks:
+			pending.append((pages_read, executor.submit(parse_chunk_worker, chunk, engine)))
+			if len(pending) < workers * 2:
+				continue
+
+			pages_read, future = pending.popleft()
+			pages, records, stats = future.result()
+			STATS.merge(stats)
+			yield pages_read, pages, records
+
+		while pending:
+			pages_read, future = pending.popleft()
+			pages, records, stats = future.result()
+			STATS.merge(stats)
+			yield pages_read, pages, records
+
+
+class TimedReader(RawIOBase):
+	"""
+	Account for the time spent decompressing the legacy marshalled dicts (c.f., --stats-path).
+	NOTE: marshal.load reads via readinto, so that's all we need.
+	"""
+
+	def __init__(self, reader: RawIOBase) -> None:
+		self.reader = reader
+
+	def readable(self) -> bool:
+		return True
+
+	def readinto(self, b) -> int:
+		# NOTE: marshal does ask for empty reads, which zstandard chokes on
+		if not len(b):
+			return 0
+
+		with STATS.timed("decompress"):
+			n = self.reader.readinto(b)
+		STATS.count("bytes", n)
+		return n
+
+
+def input_gen(input_path: Path, skip: int = 0, frames: slice | None = None) -> Iterator[dict]:
+	"""
+	Yield page records from either the page table (.parquet) or the legacy marshalled dicts (.zst),
+	starting after the first skip pages (generator).
+	Given a framed dump, frames restricts the input to that slice of frames.
+	"""
+
+	if input_path.suffix == ".parquet":
+		pf = pq.ParquetFile(input_path)
+		batches = table_batches(pf, skip)
+		total = pf.metadata.num_rows
+	elif framed.index_path(input_path).exists():
+		index = framed.read_index(input_path)[frames or slice(None)]
+		batches = frame_batches(input_path, index, skip)
+		total = sum(frame["size"] for frame in index)
+	else:
+		batches = marshal_batches(input_path, skip)
+		total = input_path.stat().st_size
+
+	# NOTE: Progress is reported once per batch, rather than on every single read
+	with Progress(console=console) as progress:
+		task = progress.add_task("Reading...", total=total)
+		for pages, position in prefetch(batches):
+			yield from pages
+			progress.update(task, completed=position)
+
+
+def extract_gen(
+	input_path: Path,
+	workers: int,
+	chunk_size: int,
+	engine: str,
+	pages_read: int = 0,
+	previous: dict[str, tuple] | None = None,
+	frames: slice | None = None,
+) -> Iterator[tuple[int, list[dict], list[dict]]]:
+	"""
+	Extract relevant pages from the input, either serially or with a pool of worker processes (generator).
+	Yields chunks of extracted pages & their manifest records, along with the amount of input pages read so far.
+	"""
+
+	chunks = chunk_gen(input_gen(input_path, pages_read, frames), chunk_size, pages_read, previous)
+
+	if workers > 1:
+		yield from parallel_parse(chunks, workers, engine)
+		return
+
+	for pages_read, chunk in chunks:
+		# pprint(chunk)
+		yield pages_read, *parse_chunk(chunk, engine)
+
+
+class StagingWriter:
+	"""
+	Stream records to numbered parquet parts in the staging directory, one row group at a time.
+	Parts are only ever referenced by a checkpoint once they're complete (c.f., roll).
+	"""
+
+	def __init__(self, staging_dir: Path, prefix: str, schema: pa.Schema, parts: list[str], row_group_size: int) -> None:
+		self.staging_dir = staging_dir
+		self.prefix = prefix
+		self.schema = schema
+		self.parts = parts
+		self.row_group_size = row_group_size
+		self.rows = []
+		self.writer = None
+
+	def write(self, row: dict) -> None:
+		self.rows.append(row)
+		if len(self.rows) >= self.row_group_size:
+			self.flush()
+
+	def flush(self) -> None:
+		"""
+		Flush a row group to disk
+		"""
+
+		if not self.rows:
+			return
+
+		self.write_table(pa.Table.from_pylist(self.rows, schema=self.schema))
+		self.rows.clear()
+
+	def write_table(self, table: pa.Table) -> None:
+		if self.writer is None:
+			part = f"{self.prefix}-{len(self.parts):05d}.parquet"
+			self.writer = pq.ParquetWriter(self.staging_dir / part, self.schema, compression="zstd")
+			self.parts.append(part)
+
+		self.writer.write_table(table)
+
+	def roll(self) -> list[str]:
+		"""
+		Flush & close the current part, and return the list of complete parts
+		"""
+
+		self.flush()
+		if self.writer is not None:
+			self.writer.close()
+			self.writer = None
+		return list(self.parts)
+
+
+def save_checkpoint(staging_dir: Path, checkpoint: dict) -> None:
+	"""
+	Atomically dump the checkpoint
+	"""
+
+	tmp_path = staging_dir / (CHECKPOINT_NAME + ".tmp")
+	tmp_path.write_text(json.dumps(checkpoint, ensure_ascii=False))
+	tmp_path.replace(staging_dir / CHECKPOINT_NAME)
+
+
+def input_identity(input_path: Path) -> dict:
+	"""
+	What tells a dump apart from another one at the same path (e.g., a newer one that's been downloaded in between)
+	"""
+
+	stat = input_path.stat()
+	return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def load_checkpoint(staging_dir: Path) -> dict:
+	"""
+	Load the last checkpoint
+	"""
+
+	return json.loads((staging_dir / CHECKPOINT_NAME).read_text())
+
+
+def load_manifest(manifest_path: Path, engine: str) -> dict[str, tuple]:
+	"""
+	Load the revision of every page of the previous run, keyed by title
+	"""
+
+	schema = pq.read_schema(manifest_path)
+	previous_engine = schema.metadata[b"engine"].decode()
+	if previous_engine != engine:
+		raise typer.BadParameter(f"The previous run used the {previous_engine} engine, not {engine}")
+
+	table = pq.read_table(manifest_path, columns=["title", "revision_id", "sha1"])
+	return dict(
+		zip(
+			table.column("title").to_pylist(),
+			zip(table.column("revision_id").to_pylist(), table.column("sha1").to_pylist()),
+		)
 	)
-	# This feels stupid... Then again, pd.array doesn't handle sets as input anyway...
-	# NOTE: This apparently confuses PyArrow during the parquet dump later :?
-	# df["categories"] = df["categories"].apply(lambda x: pd.array(list(x), dtype="string"))
-	# NOTE: Sets also happen to be mutable, so unhashable, which is annoying for unique()...
-	#       Consider using a tuple instead:
-	#       df["categories"] = df["categories"].apply(lambda x: tuple(x))
-	# NOTE: Thankfully, this doesn't matter much, because we switch to Polars for the rest of the project,
-	#       and Polars generally tends towards One Obvious Way to do stuff
-	#       (in this particular case, it groks our set as a List of strings without jumping through any hoops).
 
-	pprint(df)
 
-	# Store in parquet
-	logger.info("Dumping to disk...")
-	df.to_parquet(RAW_PARQUET_PATH, compression="zstd")
+def carried_titles(manifest_paths: list[Path]) -> pa.Array:
+	"""
+	Titles of the pages that were routed as unchanged, according to the staging manifest
+	"""
+
+	titles = [pa.array([], type=pa.string())]
+	for manifest_path in manifest_paths:
+		table = pq.read_table(manifest_path, columns=["title", "extracted"])
+		titles.append(table.filter(pc.is_null(table.column("extracted"))).column("title").combine_chunks())
+	return pa.concat_arrays(titles)
+
+
+def carry_forward(manifest_paths: list[Path], writer: StagingWriter) -> int:
+	"""
+	Carry the rows of unchanged pages forward from the previous run
+	(their contributions to book categories are carried forward by write_manifest).
+	Deleted pages don't show up in the staging manifest, so they're simply left behind.
+	Returns the amount of rows carried forward.
+	"""
+
+	titles = carried_titles(manifest_paths)
+	count = 0
+	tables = []
+	pf = pq.ParquetFile(RAW_TEXT_PATH)
+	for i in track(range(pf.num_row_groups), console=console, description="Carrying forward..."):
+		# NOTE: Polars writes large types, which we don't need
+		table = pf.read_row_group(i).cast(ROWS_SCHEMA)
+		table = table.filter(pc.is_in(table.column("title"), value_set=titles))
+		tables.append(table)
+		count += table.num_rows
+
+		# NOTE: Most rows are carried forward in practice, but coalesce sparse row groups all the same
+		if sum(table.num_rows for table in tables) >= writer.row_group_size:
+			writer.write_table(pa.concat_tables(tables))
+			tables.clear()
+	if tables:
+		writer.write_table(pa.concat_tables(tables))
+	writer.roll()
+	return count
+
+
+def write_manifest(manifest_paths: list[Path], incremental: bool, engine: str) -> None:
+	"""
+	Write the manifest for the next run: what we parsed this time around, plus what we carried forward
+	"""
+
+	schema = MANIFEST_SCHEMA.with_metadata({"engine": engine})
+	tmp_path = MANIFEST_PATH.with_suffix(".tmp")
+	with pq.ParquetWriter(tmp_path, schema, compression="zstd") as writer:
+		for manifest_path in manifest_paths:
+			table = pq.read_table(manifest_path)
+			writer.write_table(table.filter(pc.is_valid(table.column("extracted"))).cast(schema))
+
+		if incremental:
+			previous = pq.read_table(MANIFEST_PATH)
+			previous = previous.filter(pc.is_in(previous.column("title"), value_set=carried_titles(manifest_paths)))
+			writer.write_table(previous.cast(schema))
+	tmp_path.replace(MANIFEST_PATH)
+
+
+def slice_path(path: Path, frames: slice) -> Path:
+	"""
+	Where a slice of a framed dump goes, instead of path (e.g., frwikisource-current.frames-0-1000.text.parquet)
+	"""
+
+	stem, _, suffixes = path.name.partition(".")
+	tag = f"frames-{frames.start or 0}-{'end' if frames.stop is None else frames.stop}"
+	return path.with_name(f"{stem}.{tag}.{suffixes}")
+
+
+def stats_summary() -> dict:
+	"""
+	STATS summary, along with throughput figures.
+	NOTE: With --workers, the parse stages add up across processes (i.e., that's CPU time, not wall-clock time).
+	"""
+
+	summary = STATS.summary()
+	summary["pages_per_sec"] = STATS.counters["pages"] / summary["elapsed"]
+	summary["mb_per_sec"] = STATS.counters["bytes"] / 1e6 / summary["elapsed"]
+	return summary
+
+
+def write_text(part_paths: list[Path], text_path: Path, manifest_paths: list[Path] | None = None) -> None:
+	"""
+	Stitch the staging parts together into the text table.
+	Given the staging manifest (i.e., incremental runs), rows are put back in input order, as in a full run.
+	"""
+
+	if not part_paths:
+		pq.write_table(ROWS_SCHEMA.empty_table(), text_path)
+		return
+
+	lf = pl.scan_parquet(part_paths)
+	if manifest_paths:
+		# NOTE: Carried forward rows come after the parsed ones in the staging parts,
+		#       while the staging manifest lists every page of the input, in order
+		positions = pl.scan_parquet(manifest_paths).select("title").with_row_index("position")
+		lf = lf.join(positions, on="title", how="left").sort("position").drop("position")
+	lf.sink_parquet(text_path)
+
+
+def write_books(manifest_path: Path | list[Path], books_path: Path) -> None:
+	"""
+	Aggregate the contributions to book categories of every page of the manifest into the book table.
+	That's categories from pages that embed Page: pages (via the pages element or the Page template),
+	as well as publication dates from Livre: pages.
+	"""
+
+	(
+		pl.scan_parquet(manifest_path)
+		.select(pl.col("book_categories").explode())
+		.unnest("book_categories")
+		.explode("categories")
+		.drop_nulls()
+		.group_by("book_title")
+		.agg(pl.col("categories").unique().sort())
+		.sort("book_title")
+		.sink_parquet(books_path)
+	)
+
+
+@app.command()
+def main(
+	input_path: Path = PAGE_TABLE_PATH,
+	workers: int = 1,
+	chunk_size: int = CHUNK_SIZE,
+	row_group_size: int = ROW_GROUP_SIZE,
+	engine: str = "fast",
+	checkpoint_every: int = CHECKPOINT_EVERY,
+	resume: bool = False,
+	incremental: bool = False,
+	stats_path: Path | None = None,
+	stats_interval: float = 0.0,
+	frames: str | None = None,
+) -> None:
+	"""
+	Main CLI entry-point
+	"""
+
+	if engine not in ENGINES:
+		raise typer.BadParameter(f"engine must be one of {', '.join(ENGINES)}")
+
+	# Only process a slice of a framed dump, e.g., 0:1000 (i.e., Python slice syntax, w/o a step)
+	frame_range = None
+	if frames:
+		if not framed.index_path(input_path).exists():
+			raise typer.BadParameter(f"{input_path} is not a framed dump (c.f., fouille/frames.py)")
+		start, _, stop = frames.partition(":")
+		frame_range = slice(int(start) if start else None, int(stop) if stop else None)
+		if incremental:
+			raise typer.BadParameter("--incremental needs a full run (the manifest doesn't cover slices)")
+
+	# NOTE: A slice must not clobber the tables (or the staging directory) of a full run
+	text_path, books_path, staging_dir = RAW_TEXT_PATH, RAW_BOOKS_PATH, STAGING_DIR
+	if frame_range:
+		text_path, books_path, staging_dir = (
+			slice_path(path, frame_range) for path in (text_path, books_path, staging_dir)
+		)
+
+	# NOTE: Instrumentation is disabled by default, in which case it costs (next to) nothing
+	STATS.enabled = stats_path is not None
+	if STATS.enabled and stats_interval:
+		# Periodic samples go next to the summary, as JSON lines
+		samples_path = stats_path.with_suffix(".samples.jsonl")
+		samples_path.unlink(missing_ok=True)
+		last_sample = perf_counter()
+
+	if incremental and not (MANIFEST_PATH.exists() and RAW_TEXT_PATH.exists()):
+		logger.warning("No previous run to build upon, doing a full extraction")
+		incremental = False
+
+	checkpoint = {
+		"input_path": str(input_path),
+		"input": input_identity(input_path),
+		"frames": frames,
+		"engine": engine,
+		"incremental": incremental,
+		"pages_read": 0,
+		"extracted": 0,
+		"parts": [],
+		"manifest_parts": [],
+		"done": False,
+		"carried": False,
+	}
+	if resume:
+		expected, checkpoint = checkpoint, load_checkpoint(staging_dir)
+		if checkpoint["input_path"] != str(input_path) or checkpoint["frames"] != frames:
+			raise typer.BadParameter(
+				f"The last checkpoint is for {checkpoint['input_path']} [{checkpoint['frames']}], not {input_path} [{frames}]"
+			)
+		# NOTE: Parts extracted from another dump (or w/ another engine) can't be stitched together w/ new ones
+		if checkpoint.get("input") != expected["input"]:
+			raise typer.BadParameter(f"{input_path} has changed since the last checkpoint, start over w/o --resume")
+		if checkpoint.get("engine") != engine:
+			raise typer.BadParameter(f"The last checkpoint used the {checkpoint.get('engine')} engine, not {engine}")
+		logger.info(f"Resuming after {checkpoint['pages_read']} pages ({len(checkpoint['parts'])} parts)...")
+		# Drop whatever was written after the last checkpoint
+		for part_path in staging_dir.glob("*.parquet"):
+			if part_path.name not in checkpoint["parts"] + checkpoint["manifest_parts"]:
+				part_path.unlink()
+	else:
+		if staging_dir.exists():
+			shutil.rmtree(staging_dir)
+		staging_dir.mkdir(parents=True)
+
+	# Only re-parse new or modified pages
+	previous = None
+	if checkpoint["incremental"] and not checkpoint["done"]:
+		logger.info("Loading the previous manifest...")
+		previous = load_manifest(MANIFEST_PATH, engine)
+
+	# Stream extracted pages to disk, one row group at a time, checkpointing every so often
+	writer = StagingWriter(staging_dir, "part", ROWS_SCHEMA, checkpoint["parts"], row_group_size)
+	manifest_writer = StagingWriter(
+		staging_dir, "manifest", MANIFEST_SCHEMA, checkpoint["manifest_parts"], row_group_size
+	)
+	if not checkpoint["done"]:
+		last_checkpoint = checkpoint["pages_read"]
+		for pages_read, pages, records in extract_gen(
+			input_path, workers, chunk_size, engine, checkpoint["pages_read"], previous, frame_range
+		):
+			for page in pages:
+				# pprint(page)
+				# NOTE: Sets are unordered (and pyarrow doesn't grok them), so store a sorted list instead
+				page["categories"] = sorted(page["categories"])
+				writer.write(page)
+				logger.opt(colors=True).info("Extracted <green>{}</green>", page["title"])
+			for record in records:
+				manifest_writer.write(record)
+			checkpoint["extracted"] += len(pages)
+			checkpoint["pages_read"] = pages_read
+
+			if STATS.enabled and stats_interval and perf_counter() - last_sample >= stats_interval:
+				dump_json(stats_summary(), samples_path, append=True)
+				last_sample = perf_counter()
+
+			if pages_read - last_checkpoint >= checkpoint_every:
+				checkpoint["parts"] = writer.roll()
+				checkpoint["manifest_parts"] = manifest_writer.roll()
+				save_checkpoint(staging_dir, checkpoint)
+				last_checkpoint = pages_read
+				logger.info(f"Checkpoint after {pages_read} pages")
+
+		checkpoint["parts"] = writer.roll()
+		checkpoint["manifest_parts"] = manifest_writer.roll()
+		checkpoint["done"] = True
+		save_checkpoint(staging_dir, checkpoint)
+	logger.info(f"Extracted {checkpoint['extracted']} pages")
+
+	manifest_paths = [staging_dir / part for part in checkpoint["manifest_parts"]]
+	if checkpoint["incremental"] and not checkpoint["carried"]:
+		logger.info("Carrying unchanged pages forward...")
+		with STATS.timed("carry_forward"):
+			count = carry_forward(manifest_paths, writer)
+		checkpoint["parts"] = list(writer.parts)
+		checkpoint["carried"] = True
+		save_checkpoint(staging_dir, checkpoint)
+		logger.info(f"Carried {count} pages forward")
+
+	# NOTE: Given that we cannot guarantee the order in which we parse pages,
+	#       categories are restored on Page: pages later on, by joining the text rows w/ the book table...
+	#       i.e., We're likely to have seen most of the Page: pages *before*
+	#       we saw the page that embeds them from which we could pull categories...
+	logger.info("Writing the text & book tables...")
+	with STATS.timed("write_tables"):
+		write_text(
+			[staging_dir / part for part in checkpoint["parts"]],
+			text_path,
+			manifest_paths if checkpoint["incremental"] else None,
+		)
+		if frame_range:
+			# NOTE: A slice's manifest would pass for a full run's (and trigger a full reparse next time around),
+			#       so book categories come straight from the staging manifest instead
+			write_books(manifest_paths, books_path)
+		else:
+			write_manifest(manifest_paths, checkpoint["incremental"], engine)
+			write_books(MANIFEST_PATH, books_path)
+	shutil.rmtree(staging_dir)
+
+	if STATS.enabled:
+		dump_json(stats_summary(), stats_path)
+		logger.info(f"Dumped stats to {stats_path}")
+
+	# NOTE: categories is a List of strings, which Polars groks natively for the rest of the project.
+	pprint(pq.read_schema(text_path))
+	pprint(pq.read_schema(books_path))
 
 
 # c.f., https://github.com/Delgan/loguru/issues/444#issuecomment-2507148185
@@ -388,4 +1177,4 @@ logger.configure(
 
 
 if __name__ == "__main__":
-	main()
+	app()
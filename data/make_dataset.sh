@@ -1,7 +1,8 @@
 #!/usr/bin/env bash
 #
-# Download a Wikisource dump, convert each page to a Python dictionary, then marshall and compress the whole thing.
-# NOTE: Beware: requires ~24GB of RAM.
+# Download a Wikisource dump, and stream the relevant fields of each page to a zstd compressed parquet table.
+# NOTE: Memory usage is bounded by the ingest batch size (c.f., fouille/ingest.py).
+#       The legacy xmltodict pipeline (which requires ~24GB of RAM) is still available below, commented out.
 #
 
 # Sanity check
@@ -10,7 +11,7 @@ if [[ -z "${VIRTUAL_ENV}" ]] ; then
 	exit 1
 fi
 
-for tool in wget bzcat zstd ; do
+for tool in wget bzcat ; do
 	if ! command -v "${tool}" ; then
 		>&2 echo "!! ${tool} is not available"
 		exit 1
@@ -33,11 +34,20 @@ DUMP_DATE="20250320"
 # Out own mirror
 DUMP_URI="https://tal-m1-fouille.s3.gra.io.cloud.ovh.net/data/external/frwikisource-${DUMP_DATE}-pages-meta-current.xml.bz2"
 
-# Path to the XMLTODICT CLI script
-XMLTODICT=".venv/lib/python3.12/site-packages/xmltodict.py"
-
 # Do everything in one pass, the only thing that should touch local storage is the final step.
+# NOTE: bzcat runs in its own process, so decompression overlaps with the XML parsing.
 wget "${DUMP_URI}" -O - \
 | bzcat - \
-| python "${XMLTODICT}" 2 \
-| zstd > "${RAW_DATA_DIR}/frwikisource-current.dicts.zst"
+| python "${SCRIPT_DIR}/../fouille/ingest.py" --output-path "${RAW_DATA_DIR}/frwikisource-current.pages.parquet" -
+
+# Legacy pipeline: marshalled xmltodict dictionaries (c.f., extract_data.py's page_gen)
+# NOTE: These are packed in independently compressed frames w/ a sidecar index (c.f., fouille/frames.py),
+#       so you can jump to any page, or process a slice of the dump (c.f., extract_data.py's --frames).
+#       Kept (commented out) because it's the only way to build that framed dump: the page table above has no frames,
+#       so --frames (and fouille/frames.py) need it. Uncomment it to get one, memory permitting.
+# Path to the XMLTODICT CLI script
+#XMLTODICT=".venv/lib/python3.12/site-packages/xmltodict.py"
+#wget "${DUMP_URI}" -O - \
+#| bzcat - \
+#| python "${XMLTODICT}" 2 \
+#| python "${SCRIPT_DIR}/../fouille/frames.py" pack --output-path "${RAW_DATA_DIR}/frwikisource-current.dicts.zst" -
@@ -17,14 +17,22 @@ PROCESSED_DATA_DIR = DATA_DIR / "processed"
 EXTERNAL_DATA_DIR = DATA_DIR / "external"
 
 MODELS_DIR = PROJ_ROOT / "models"
+# Fitted vectorizers, versioned (c.f., fouille/features.py), and the current one
+VECTORIZERS_DIR = MODELS_DIR / "vectorizers"
+VECTORIZER_PATH = MODELS_DIR / "vectorizer.parquet"
 
 REPORTS_DIR = PROJ_ROOT / "reports"
 FIGURES_DIR = REPORTS_DIR / "figures"
 CONFUSION_DIR = FIGURES_DIR / "confusion"
 
 # Datasets
+RAW_PAGES_DATASET = RAW_DATA_DIR / "frwikisource-current.pages.parquet"
+# Text rows & book categories, as extracted by data/extract_data.py (c.f., restore_categories in fouille/dataset.py)
+RAW_TEXT_DATASET = INTERIM_DATA_DIR / "frwikisource-current.text.parquet"
+RAW_BOOKS_DATASET = INTERIM_DATA_DIR / "frwikisource-current.books.parquet"
 RAW_DATASET = INTERIM_DATA_DIR / "frwikisource-current.parquet"
 CLEAN_DATASET = INTERIM_DATA_DIR / "frwikisource-cleaned.parquet"
+# NOTE: Full, train, test & dev are hive partitioned datasets (i.e., directories), c.f., scan_dataset in fouille/dataset.py
 FULL_DATASET = PROCESSED_DATA_DIR / "frwikisource-full.parquet"
 TRAIN_DATASET = PROCESSED_DATA_DIR / "frwikisource-train.parquet"
 TEST_DATASET = PROCESSED_DATA_DIR / "frwikisource-test.parquet"
@@ -33,6 +41,10 @@ TINY_TEST_DATASET = PROCESSED_DATA_DIR / "frwikisource-test-tiny.parquet"
 TINY_DEV_DATASET = PROCESSED_DATA_DIR / "frwikisource-dev-tiny.parquet"
 MICRO_DEV_DATASET = PROCESSED_DATA_DIR / "frwikisource-dev-micro.parquet"
 
+# Dating service (c.f., fouille/modeling/serve.py)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+
 # Visualizations
 RAW_CATEGORIES = INTERIM_DATA_DIR / "raw-cats.csv"
 RAW_CATEGORIES_LIST = INTERIM_DATA_DIR / "raw-cats-list.json"
@@ -1,16 +1,23 @@
 #!/usr/bin/env python3
 
 
+from functools import partial
+from hashlib import blake2b
+from pathlib import Path
+import shutil
+
 from loguru import logger
 import polars as pl
-from polars_splitters import split_into_train_eval
 import typer
 
 from fouille.config import (
 	CLEAN_DATASET,
 	DEV_DATASET,
 	FULL_DATASET,
+	MICRO_DEV_DATASET,
+	RAW_BOOKS_DATASET,
 	RAW_DATASET,
+	RAW_TEXT_DATASET,
 	TEST_DATASET,
 	TINY_DEV_DATASET,
 	TINY_TEST_DATASET,
@@ -19,17 +26,82 @@ from fouille.config import (
 
 app = typer.Typer()
 
+# Page: titles are the title of the book's index (e.g., a djvu file), followed by the page number
+PAGE_NUMBER_RE = r"/\d+$"
+
+# Split sizes (dev gets the rest), and the share of test & dev that also goes into the tiny splits
+TRAIN_SIZE = 0.8
+TEST_SIZE = 0.1
+TINY_SIZE = 0.15
+# NOTE: Changing this reshuffles every split
+SPLIT_SALT = b"fouille"
+
+# Processed datasets are hive partitioned by gold class (and optionally by quality), e.g., semicentury=1800/0.parquet
+# (or semicentury=1800/quality=75/0.parquet),
+# so that filters on those skip whole files (and filters on pubyear skip row groups, thanks to min/max statistics)
+PARTITION_SCHEMA = {"semicentury": pl.UInt16, "quality": pl.UInt8}
+DATASET_COLUMNS = ["title", "pubyear", "quality", "text", "semicentury"]
+# NOTE: Rows are whole pages of text, so keep row groups on the smaller side
+ROW_GROUP_SIZE = 8192
+
+# Default sample size (i.e., what we cut experiments down to)
+SAMPLE_SIZE = 10_000
+
+SPLIT_DATASETS = {
+	"train": TRAIN_DATASET,
+	"test": TEST_DATASET,
+	"dev": DEV_DATASET,
+	"tiny_test": TINY_TEST_DATASET,
+	"tiny_dev": TINY_DEV_DATASET,
+}
+
+
+def book_key(title: pl.Expr) -> pl.Expr:
+	"""
+	Derive the book a Page: page belongs to from its title (w/o the namespace)
+	"""
 
-def extract_gold_classes() -> None:
+	return title.str.replace(PAGE_NUMBER_RE, "")
+
+
+def restore_categories_lf() -> pl.LazyFrame:
 	"""
-	Pull the most recent publication year from each page's categories
+	Pages under the Page: namespace do *not* have categories, so pull them from their book
 	"""
 
-	logger.info("Extracting exact gold classes from raw data...")
+	# NOTE: Some pages embed specific pages of a book (e.g., via {{Page|Foo.djvu/12}}), so normalize these, too
+	lf_books = (
+		pl.scan_parquet(RAW_BOOKS_DATASET)
+		.group_by(book=book_key(pl.col("book_title")))
+		.agg(book_categories=pl.col("categories").flatten().unique())
+	)
+
+	return (
+		pl.scan_parquet(RAW_TEXT_DATASET)
+		.with_columns(
+			book=pl.when(pl.col("title").str.starts_with("Page:")).then(
+				book_key(pl.col("title").str.strip_prefix("Page:"))
+			)
+		)
+		# NOTE: Keep the row order stable, as the splits depend on it
+		.join(lf_books, on="book", how="left", maintain_order="left")
+		.with_columns(
+			categories=pl.concat_list(
+				"categories", pl.col("book_categories").fill_null(pl.lit([], dtype=pl.List(pl.String)))
+			)
+			.list.unique()
+			.list.sort()
+		)
+		.select("title", "categories", "quality", "text")
+	)
 
-	lf = pl.scan_parquet(RAW_DATASET)
 
-	lf = (
+def gold_classes_lf(lf: pl.LazyFrame) -> pl.LazyFrame:
+	"""
+	Pull the most recent publication year from each page's categories
+	"""
+
+	return (
 		lf.with_columns(
 			pubyear=pl.col("categories")
 			.list.eval(
@@ -56,21 +128,13 @@ def extract_gold_classes() -> None:
 	)
 	# c.f., lf.describe() to confirm we no longer have bogus max values
 
-	# Dump to disk
-	logger.info("Dumping to disk...")
-	lf.sink_parquet(CLEAN_DATASET)
-
 
-def label_gold_classes() -> None:
+def gold_labels_lf(lf: pl.LazyFrame) -> pl.LazyFrame:
 	"""
 	Label publication years in intervals of 50 years
 	"""
 
-	logger.info("Labelling clean data w/ gold classes...")
-
-	lf = pl.scan_parquet(CLEAN_DATASET)
-
-	lf = lf.with_columns(
+	return lf.with_columns(
 		# Chop things up in 50 years periods
 		# (by rounding pubyear down to the nearest multiple of 50)
 		semicentury=pl.col("pubyear") // 50 * 50
@@ -78,95 +142,328 @@ def label_gold_classes() -> None:
 	# NOTE: Confirm groupings w/ lf.group_by("semicentury").agg(pl.all()).collect()
 	#                            lf.group_by("semicentury").count().collect()
 
-	# Dump to disk
-	logger.info("Dumping to disk...")
-	lf.sink_parquet(FULL_DATASET)
+
+def stable_hash(s: pl.Series, salt: bytes = SPLIT_SALT) -> pl.Series:
+	"""
+	Hash strings to [0, 2**53), reproducibly across runs, machines & Polars versions (unlike Expr.hash)
+	"""
+
+	return pl.Series(
+		s.name,
+		[int.from_bytes(blake2b(v.encode(), digest_size=8, salt=salt).digest()) >> 11 for v in s],
+		dtype=pl.UInt64,
+	)
 
 
-def split_dataset() -> None:
+def split_key(by_book: bool) -> pl.Expr:
 	"""
-	Do an 80/10/10 train/test/dev stratified split (i.e., preserving class distribution)
+	What we hash to assign a row to a split: either its title, or the book it belongs to
+	(so that pages of a same book don't end up on both sides of the split)
 	"""
 
-	logger.info("Stratified split on gold class...")
+	if not by_book:
+		return pl.col("title")
 
-	lf = pl.scan_parquet(FULL_DATASET)
-
-	# Start with a 80/20 split
-	lf_train, lf_eval = split_into_train_eval(
-		lf,
-		eval_rel_size=0.2,
-		stratify_by="semicentury",
-		shuffle=True,
-		seed=42,
-		validate=True,
-		as_lazy=True,
-		rel_size_deviation_tolerance=0.1,
+	title = pl.col("title")
+	return (
+		pl.when(title.str.starts_with("Page:"))
+		.then(book_key(title.str.strip_prefix("Page:")))
+		# Chapters & such are subpages of the book's main page (e.g., Les Misérables/Tome 1/Livre 1)
+		.otherwise(title.str.split("/").list.first())
 	)
 
-	# And split the 20 in half for an 80/10/10
-	lf_test, lf_dev = split_into_train_eval(
-		lf_eval,
-		eval_rel_size=0.5,
-		stratify_by="semicentury",
-		shuffle=True,
-		seed=42,
-		validate=True,
-		as_lazy=True,
-		rel_size_deviation_tolerance=0.1,
+
+def split_hash(by_book: bool) -> pl.Expr:
+	return split_key(by_book).map_batches(stable_hash, return_dtype=pl.UInt64, is_elementwise=True)
+
+
+def split_thresholds(lf: pl.LazyFrame, by_book: bool) -> pl.DataFrame:
+	"""
+	Per-class hash thresholds, so that every split gets its exact share of every gold class
+	(i.e., a stratified split that doesn't need to shuffle anything).
+	NOTE: Only needs the titles & labels (the text is never read), so it's cheap compared to the splits themselves.
+	      This is collected right away, rather than joined lazily: the streaming engine would otherwise have
+	      to hold on to every row (text included) until the last cutoff is known.
+	"""
+
+	# Cumulative fractions of each class, in hash order: train, then test (starting w/ tiny test), then dev (ditto)
+	cutoffs = {
+		"train": TRAIN_SIZE,
+		"tiny_test": TRAIN_SIZE + TEST_SIZE * TINY_SIZE,
+		"test": TRAIN_SIZE + TEST_SIZE,
+		"tiny_dev": TRAIN_SIZE + TEST_SIZE + (1 - TRAIN_SIZE - TEST_SIZE) * TINY_SIZE,
+	}
+
+	def cutoff(q: float) -> pl.Expr:
+		# Exactly round(n * q) hashes of a class are below its cutoff
+		# (which is above every hash if that's all of them)
+		k = (pl.len() * q).round().cast(pl.UInt32)
+		return (
+			pl.when(k < pl.len())
+			.then(pl.col("hash").sort().get(k.clip(upper_bound=pl.len() - 1)))
+			.otherwise(pl.lit(1 << 53, dtype=pl.UInt64))
+		)
+
+	return (
+		lf.select("semicentury", hash=split_hash(by_book))
+		.group_by("semicentury")
+		.agg(**{f"{name}_max": cutoff(q) for name, q in cutoffs.items()})
+		.collect(engine="streaming")
 	)
 
+
+def splits_lf(lf: pl.LazyFrame, by_book: bool = False) -> dict[str, pl.LazyFrame]:
+	"""
+	Do an 80/10/10 train/test/dev stratified split, along with tiny test & dev splits
+	(15% of each, to help iterating more quickly on the classification).
+	Rows are assigned by hash, so this runs in the streaming engine, and is the same on every run.
+	"""
+
+	thresholds = split_thresholds(lf, by_book)
+	lf = lf.with_columns(hash=split_hash(by_book)).join(
+		thresholds.lazy(), on="semicentury", how="left", maintain_order="left"
+	)
+
+	h = pl.col("hash")
+	splits = {
+		"train": h < pl.col("train_max"),
+		"test": (h >= pl.col("train_max")) & (h < pl.col("test_max")),
+		"dev": h >= pl.col("test_max"),
+		# NOTE: We lose a bunch of categories in the process (and a few are left with *very* few members...)
+		"tiny_test": (h >= pl.col("train_max")) & (h < pl.col("tiny_test_max")),
+		"tiny_dev": (h >= pl.col("test_max")) & (h < pl.col("tiny_dev_max")),
+	}
+	columns = ["title", "pubyear", "quality", "text", "semicentury"]
+	return {name: lf.filter(predicate).select(columns) for name, predicate in splits.items()}
+
+
+def scan_dataset(path: Path) -> pl.LazyFrame:
+	"""
+	Scan a processed dataset, partitioned or not
+	"""
+
+	if not path.is_dir():
+		return pl.scan_parquet(path)
+
+	# NOTE: Partition keys come last, so restore the usual column order
+	return pl.scan_parquet(path, hive_partitioning=True, hive_schema=PARTITION_SCHEMA).select(DATASET_COLUMNS)
+
+
+def remove_dataset(path: Path) -> None:
+	"""
+	Clear the previous version of a dataset, so that no stale partitions are left behind
+	"""
+
+	if path.is_dir():
+		shutil.rmtree(path)
+	else:
+		path.unlink(missing_ok=True)
+
+
+def sink_dataset(lf: pl.LazyFrame, path: Path, by_quality: bool = False, lazy: bool = False) -> pl.LazyFrame | None:
+	"""
+	Sink a processed dataset, partitioned by gold class (and quality, if requested)
+	"""
+
+	remove_dataset(path)
+	keys = ["semicentury", "quality"] if by_quality else ["semicentury"]
+	return lf.sink_parquet(
+		# NOTE: PartitionByKey nests directories in the reverse order of its keys (as of polars 1.29)
+		pl.PartitionByKey(path, by=keys[::-1], include_key=False),
+		row_group_size=ROW_GROUP_SIZE,
+		statistics=True,
+		mkdir=True,
+		lazy=lazy,
+	)
+
+
+def sink_splits(
+	splits: dict[str, pl.LazyFrame], by_quality: bool = False, lazy: bool = False
+) -> list[pl.LazyFrame | None]:
+	sinks = []
+	for name, lf in splits.items():
+		path = SPLIT_DATASETS[name]
+		if not name.startswith("tiny_"):
+			sinks.append(sink_dataset(lf, path, by_quality, lazy))
+			continue
+
+		# The tiny splits are small enough to stay as single files (and we want them in CSV, too)
+		remove_dataset(path)
+		sinks.append(lf.sink_parquet(path, row_group_size=ROW_GROUP_SIZE, lazy=lazy))
+		sinks.append(lf.sink_csv(path.with_suffix(".csv"), lazy=lazy))
+	return sinks
+
+
+def restore_categories() -> None:
+	logger.info("Restoring categories on Page: pages...")
+
+	lf = restore_categories_lf()
+
 	# Dump to disk
 	logger.info("Dumping to disk...")
-	lf_train.sink_parquet(TRAIN_DATASET)
-	lf_test.sink_parquet(TEST_DATASET)
-	lf_dev.sink_parquet(DEV_DATASET)
+	lf.sink_parquet(RAW_DATASET)
+
 
+def extract_gold_classes() -> None:
+	logger.info("Extracting exact gold classes from raw data...")
 
-def tiny_splits() -> None:
+	lf = gold_classes_lf(pl.scan_parquet(RAW_DATASET))
+
+	# Dump to disk
+	logger.info("Dumping to disk...")
+	lf.sink_parquet(CLEAN_DATASET)
+
+
+def label_gold_classes(by_quality: bool = False) -> None:
+	logger.info("Labelling clean data w/ gold classes...")
+
+	lf = gold_labels_lf(pl.scan_parquet(CLEAN_DATASET))
+
+	# Dump to disk
+	logger.info("Dumping to disk...")
+	sink_dataset(lf, FULL_DATASET, by_quality)
+
+
+def split_dataset(by_book: bool = False, by_quality: bool = False) -> None:
+	logger.info("Stratified split on gold class...")
+
+	splits = splits_lf(scan_dataset(FULL_DATASET), by_book)
+
+	# Dump to disk
+	logger.info("Dumping to disk...")
+	sink_splits(splits, by_quality)
+
+
+def fused_build(intermediates: bool = False, by_book: bool = False, by_quality: bool = False) -> None:
+	"""
+	Build every output from a single lazy plan, materialized in one go (after a light pass for the split thresholds).
+	The full dataset is written alongside the splits (plots & sampling read it),
+	the raw & clean intermediate datasets only if requested.
+	"""
+
+	logger.info("Building the fused plan...")
+
+	lf_raw = restore_categories_lf()
+	lf_clean = gold_classes_lf(lf_raw)
+	lf_full = gold_labels_lf(lf_clean)
+	# NOTE: This computes the split thresholds right away, in a first pass that only reads titles & categories
+	splits = splits_lf(lf_full, by_book)
+
+	sinks = [*sink_splits(splits, by_quality, lazy=True), sink_dataset(lf_full, FULL_DATASET, by_quality, lazy=True)]
+	if intermediates:
+		sinks += [
+			lf_raw.sink_parquet(RAW_DATASET, lazy=True),
+			lf_clean.sink_parquet(CLEAN_DATASET, lazy=True),
+		]
+
+	# NOTE: Shared subplans are only computed once, so this is the only pass over the text
+	logger.info("Dumping to disk...")
+	pl.collect_all(sinks, engine="streaming")
+
+
+def sample_quotas(counts: dict[int, int], size: int, balanced: bool, max_per_class: int | None) -> dict[int, int]:
+	"""
+	Rows to draw from each class to get exactly size rows (or as many as the caps allow),
+	either proportionally to class sizes, or as evenly as possible.
+	Whatever a class can't provide (because it's too small, or capped) goes to the others.
+	"""
+
+	capacity = {c: min(n, max_per_class) if max_per_class else n for c, n in counts.items()}
+	quotas = dict.fromkeys(counts, 0)
+	remaining = min(size, sum(capacity.values()))
+	while remaining:
+		classes = [c for c in sorted(counts) if quotas[c] < capacity[c]]
+		weights = {c: 1 if balanced else counts[c] for c in classes}
+		total = sum(weights.values())
+		shares = {c: remaining * weights[c] / total for c in classes}
+		grants = {c: min(int(shares[c]), capacity[c] - quotas[c]) for c in classes}
+		# Hand out the rows lost to rounding by largest remainder
+		leftover = remaining - sum(grants.values())
+		room = [c for c in classes if grants[c] < capacity[c] - quotas[c]]
+		for c in sorted(room, key=lambda c: shares[c] - int(shares[c]), reverse=True)[:leftover]:
+			grants[c] += 1
+		for c, n in grants.items():
+			quotas[c] += n
+			remaining -= n
+	return quotas
+
+
+@app.command()
+def sample(
+	input_path: Path = DEV_DATASET,
+	output_path: Path = MICRO_DEV_DATASET,
+	size: int = SAMPLE_SIZE,
+	balanced: bool = False,
+	max_per_class: int | None = None,
+	seed: int = 42,
+) -> None:
 	"""
-	Split dev & test into even smaller chunks to help iterating more quickly on the classification
+	Draw an exact size sample, stratified on gold class (or class balanced), from any processed dataset.
+	Rows are picked by hash (lowest first, per class), so only titles & labels are loaded to pick them,
+	and for a given seed, smaller samples are subsets of larger ones (e.g., for a 10k, 50k, 200k, 1M scaling ladder).
 	"""
 
-	logger.info("Tiny splits...")
+	if output_path.resolve() == input_path.resolve():
+		raise typer.BadParameter("Cannot sample a dataset in place")
+
+	logger.info(f"Sampling {size} rows from {input_path}...")
 
-	# We'll work on 15% of those to keep things practical in terms of computational costs
-	# NOTE: We lose a bunch of categories in the process (and a few are left with *very* few members...)
-	lf = pl.scan_parquet(TEST_DATASET)
-	lf_tiny_test, _ = split_into_train_eval(
-		lf,
-		eval_rel_size=0.85,
-		stratify_by="semicentury",
-		shuffle=True,
-		seed=42,
-		validate=True,
-		as_lazy=True,
-		rel_size_deviation_tolerance=0.1,
+	# NOTE: Different salt than the splits, as they already depend on the hash order
+	sample_hash = pl.col("title").map_batches(
+		partial(stable_hash, salt=f"sample-{seed}".encode()), return_dtype=pl.UInt64, is_elementwise=True
 	)
-	lf_tiny_test.sink_parquet(TINY_TEST_DATASET)
-	lf_tiny_test.sink_csv(TINY_TEST_DATASET.with_suffix(".csv"))
-
-	lf = pl.scan_parquet(DEV_DATASET)
-	lf_tiny_dev, _ = split_into_train_eval(
-		lf,
-		eval_rel_size=0.85,
-		stratify_by="semicentury",
-		shuffle=True,
-		seed=42,
-		validate=True,
-		as_lazy=True,
-		rel_size_deviation_tolerance=0.1,
+
+	lf = scan_dataset(input_path)
+	keys = lf.select("semicentury", hash=sample_hash).collect(engine="streaming")
+	counts = dict(keys.group_by("semicentury").len().iter_rows())
+	quotas = sample_quotas(counts, size, balanced, max_per_class)
+	for c in sorted(quotas):
+		logger.info(f"{c}: {quotas[c]} of {counts[c]}")
+
+	thresholds = (
+		keys.join(
+			pl.DataFrame(
+				{"semicentury": list(quotas), "quota": list(quotas.values())},
+				schema={"semicentury": pl.UInt16, "quota": pl.UInt32},
+			),
+			on="semicentury",
+		)
+		.sort("hash")
+		.filter(pl.int_range(pl.len()).over("semicentury") < pl.col("quota"))
+		.group_by("semicentury")
+		.agg(max_hash=pl.col("hash").max())
 	)
-	lf_tiny_dev.sink_parquet(TINY_DEV_DATASET)
-	lf_tiny_dev.sink_csv(TINY_DEV_DATASET.with_suffix(".csv"))
+
+	lf = (
+		lf.with_columns(hash=sample_hash)
+		.join(thresholds.lazy(), on="semicentury", how="inner", maintain_order="left")
+		.filter(pl.col("hash") <= pl.col("max_hash"))
+		.drop("hash", "max_hash")
+	)
+
+	logger.info("Dumping to disk...")
+	lf.sink_parquet(output_path, row_group_size=ROW_GROUP_SIZE)
+	logger.success(f"Wrote {sum(quotas.values())} rows to {output_path}")
 
 
 @app.command()
-def main() -> None:
+def main(fused: bool = True, intermediates: bool = False, by_book: bool = False, by_quality: bool = False) -> None:
+	"""
+	Build the dataset, either as a single fused plan (default), or one step at a time
+	(in which case every intermediate dataset is written, and scanned again by the next step).
+	The fused plan only writes the raw & clean intermediate datasets w/ --intermediates.
+	With --by-book, splits are assigned per book rather than per page.
+	With --by-quality, processed datasets are partitioned by quality on top of gold class.
+	"""
+
+	if fused:
+		fused_build(intermediates, by_book, by_quality)
+		return
+
+	restore_categories()
 	extract_gold_classes()
-	label_gold_classes()
-	split_dataset()
-	tiny_splits()
+	label_gold_classes(by_quality)
+	split_dataset(by_book, by_quality)
 
 
 if __name__ == "__main__":
@@ -1,70 +1,403 @@
 #!/usr/bin/env python3
 
 
+from datetime import datetime, timezone
+from hashlib import blake2b
+import json
 from pathlib import Path
 import re
+import shutil
+from typing import Annotated
 
-import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
+import numpy as np
+import polars as pl
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from scipy import sparse
 from sklearn.model_selection import train_test_split
-import tiktoken as tk
 import typer
 
-from fouille.config import PROCESSED_DATA_DIR
+from fouille.config import PROCESSED_DATA_DIR, VECTORIZER_PATH, VECTORIZERS_DIR
+from fouille.dataset import scan_dataset
+from fouille.tokens import TIKTOKEN, encode, read_batches
 
 app = typer.Typer()
 
 # Arguments
-# $1 : parquet file of text and semicenturies (e.g., MICRO_DEV_DATASET)
+# $1 : parquet file (or partitioned dataset) of text and semicenturies (e.g., MICRO_DEV_DATASET),
+#      or its tokenized version (c.f., fouille/tokens.py), which skips tokenization entirely
+# --semicentury & --quality (repeatable) only keep the matching rows (and, on partitioned datasets, only read those)
+# Features are saved as CSR matrices (X_train.npz & X_test.npz)
+# --chunked vectorizes out-of-core, one record batch at a time, into CSR shards (X_train/00000.npz, ...),
+#           w/ a first pass for document frequencies (or none at all w/ --hashing)
+# The fitted vocabulary is saved under MODELS_DIR/vectorizers (versioned by training data fingerprint & settings),
+# and as MODELS_DIR/vectorizer.parquet; --vectorizer reuses one instead of fitting (as does the transform command)
 
-TIKTOKEN = tk.get_encoding("o200k_base")
 REGEXP = re.compile(r"[^\s\.;,]+")
+# Ignore tokens that appear in fewer documents than that (an absolute count, or a proportion if < 1)
+# NOTE: Features are stored sparse, so there's no need to keep the vocabulary tiny, only to drop the rarest tokens
+MIN_DF = 5
+# Documents per batch (out-of-core path)
+BATCH_SIZE = 16384
+TEST_SIZE = 0.2
 
-
-def anal(str):
-	return TIKTOKEN.encode(str)
+VECTORIZER_SCHEMA = pa.schema(
+	[
+		("token", pa.uint32()),
+		# Decoded token (for humans)
+		("text", pa.string()),
+	]
+)
 
 
 def regex(str):
 	return [a for a in REGEXP.finditer(str)]
 
 
-def vectorize(input_parquet: Path) -> None:
+class Fingerprint:
+	"""
+	Content hash of a set of documents (titles & token ids), regardless of how they were batched
+	"""
+
+	def __init__(self) -> None:
+		self.titles = blake2b(digest_size=16)
+		self.lengths = blake2b(digest_size=16)
+		self.tokens = blake2b(digest_size=16)
+
+	def update(self, titles: list[str], tokens: pa.ListArray | pa.LargeListArray) -> None:
+		self.titles.update("".join(f"{title}\n" for title in titles).encode())
+		self.lengths.update(np.diff(tokens.offsets.to_numpy()).astype(np.int64).tobytes())
+		self.tokens.update(tokens.flatten().to_numpy().astype(np.uint32).tobytes())
+
+	def hexdigest(self) -> str:
+		return blake2b(self.titles.digest() + self.lengths.digest() + self.tokens.digest(), digest_size=16).hexdigest()
+
+
+def save_vectorizer(vocabulary: np.ndarray, fingerprint: str, documents: int, min_df: float, hashing: bool) -> Path:
+	"""
+	Save a fitted vocabulary (token ids, in column order), versioned by training data & settings,
+	and make it the current one
+	"""
+
+	# NOTE: min_df is a float on the command line, so that versions don't depend on how it was passed
+	settings = {"encoding": TIKTOKEN.name, "fingerprint": fingerprint, "min_df": float(min_df), "hashing": hashing}
+	version = blake2b(json.dumps(settings, sort_keys=True).encode(), digest_size=8).hexdigest()
+	metadata = {
+		**settings,
+		"version": version,
+		"documents": documents,
+		"features": len(vocabulary),
+		"created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+	}
+
+	table = pa.table(
+		[pa.array(vocabulary, type=pa.uint32()), pa.array([TIKTOKEN.decode([int(t)]) for t in vocabulary])],
+		schema=VECTORIZER_SCHEMA.with_metadata({"vectorizer": json.dumps(metadata)}),
+	)
+	VECTORIZERS_DIR.mkdir(parents=True, exist_ok=True)
+	path = VECTORIZERS_DIR / f"{version}.parquet"
+	pq.write_table(table, path, compression="zstd")
+	shutil.copyfile(path, VECTORIZER_PATH)
+	return path
+
+
+def load_vectorizer(path: Path) -> tuple[np.ndarray, dict]:
+	"""
+	Load a fitted vocabulary, along w/ its metadata
+	"""
+
+	table = pq.read_table(path)
+	metadata = json.loads(table.schema.metadata[b"vectorizer"])
+	if metadata["encoding"] != TIKTOKEN.name:
+		raise typer.BadParameter(f"{path} was fitted on {metadata['encoding']} tokens, not {TIKTOKEN.name}")
+	return table.column("token").to_numpy().astype(np.int64), metadata
+
+
+def clear_features(path: Path) -> None:
+	"""
+	Clear previous features (whole or sharded)
+	"""
+
+	path.with_suffix(".npz").unlink(missing_ok=True)
+	shutil.rmtree(path, ignore_errors=True)
+
+
+def save_features(name: str, X: sparse.csr_matrix) -> None:
+	"""
+	Save a whole feature matrix (replacing its shards, if any)
+	"""
+
+	clear_features(PROCESSED_DATA_DIR / name)
+	sparse.save_npz(PROCESSED_DATA_DIR / f"{name}.npz", X)
+
+
+def save_labels(name: str, y: np.ndarray, version: str) -> None:
+	"""
+	Save the labels of a feature matrix (e.g., y_train.parquet), w/ the version of the vectorizer behind it
+	"""
+
+	table = pa.table({"semicentury": y}).replace_schema_metadata({"vectorizer": version})
+	pq.write_table(table, PROCESSED_DATA_DIR / f"y_{name}.parquet", compression="zstd")
+
+
+def features_vectorizer(path: Path) -> str:
+	"""
+	Version of the vectorizer behind a feature matrix: either from a transform (rows.parquet),
+	or from features.py (e.g., y_train.parquet for X_train)
+	"""
+
+	labels_path = path / "rows.parquet"
+	if not labels_path.exists():
+		labels_path = path.with_name(f"y_{path.name.removeprefix('X_')}.parquet")
+	metadata = pq.read_schema(labels_path).metadata or {}
+	if b"vectorizer" not in metadata:
+		raise typer.BadParameter(f"No vectorizer recorded for {path}, re-run features.py")
+	return metadata[b"vectorizer"].decode()
+
+
+def shard_paths(path: Path) -> list[Path]:
+	"""
+	Shards of a feature matrix (a whole matrix being a single shard)
+	"""
+
+	if path.with_suffix(".npz").exists():
+		return [path.with_suffix(".npz")]
+	return sorted(path.glob("*.npz"))
+
+
+def load_shards(path: Path) -> sparse.csr_matrix:
+	return sparse.vstack([sparse.load_npz(shard) for shard in shard_paths(path)], format="csr")
+
+
+def load_features(name: str) -> sparse.csr_matrix:
+	"""
+	Load a feature matrix, whether it was saved whole, or in shards
+	"""
+
 	folder = PROCESSED_DATA_DIR
+	if (folder / f"{name}.npz").exists():
+		return sparse.load_npz(folder / f"{name}.npz")
+	return load_shards(folder / name)
 
-	print("reading parquet")
-	data = pd.read_parquet(input_parquet)
-	texts = data["text"]
-	cats = data["semicentury"]
 
-	vectorizer = CountVectorizer(analyzer=anal, min_df=0.05)
+def features_path(path: Path) -> Path:
+	"""
+	Where the transform command puts the features of a dataset (e.g., frwikisource-dev.features)
+	"""
+
+	return path.with_name(path.stem.removesuffix(".tokens") + ".features")
+
 
+def batch_predicate(semicenturies: list[int] | None, qualities: list[int] | None) -> ds.Expression | None:
+	predicate = None
+	if semicenturies:
+		predicate = ds.field("semicentury").isin(semicenturies)
+	if qualities:
+		expr = ds.field("quality").isin(qualities)
+		predicate = expr if predicate is None else predicate & expr
+	return predicate
+
+
+def batch_tokens(batch: pa.RecordBatch) -> pa.ListArray | pa.LargeListArray:
+	"""
+	Token ids of a batch (tokenizing it if need be)
+	"""
+
+	if "tokens" in batch.schema.names:
+		return batch.column("tokens")
+	return encode(batch.column("text").to_pylist())
+
+
+def token_matrix(tokens: pa.ListArray | pa.LargeListArray) -> sparse.csr_matrix:
+	"""
+	Document-term counts, w/ token ids as column indices
+	"""
+
+	# NOTE: Offsets aren't rebased on sliced arrays, values are
+	offsets = tokens.offsets.to_numpy()
+	indptr = offsets - offsets[0]
+	indices = tokens.flatten().to_numpy().astype(np.int32)
+	X = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr), shape=(len(tokens), TIKTOKEN.n_vocab))
+	X.sum_duplicates()
+	return X
+
+
+def doc_columns(input_parquet: Path) -> list[str]:
+	# NOTE: Pre-tokenized documents skip tokenization entirely
+	schema = scan_dataset(input_parquet).collect_schema()
+	return ["title", "tokens" if "tokens" in schema else "text"] + (["semicentury"] if "semicentury" in schema else [])
+
+
+def vectorize_chunked(
+	input_parquet: Path,
+	semicenturies: list[int] | None = None,
+	qualities: list[int] | None = None,
+	min_df: float = MIN_DF,
+	hashing: bool = False,
+	batch_size: int = BATCH_SIZE,
+	vectorizer_path: Path | None = None,
+) -> None:
+	"""
+	Out-of-core version of vectorize: memory usage is bounded by a batch of documents (and its features).
+	With hashing, every token id is a feature (token ids are their own, collision-free, hash),
+	which saves the document frequency pass, at the cost of a larger (but still sparse) feature space.
+	"""
+
+	folder = PROCESSED_DATA_DIR
+	columns = doc_columns(input_parquet)
+	predicate = batch_predicate(semicenturies, qualities)
+
+	def batches():
+		return read_batches(input_parquet, columns, batch_size, predicate)
+
+	fingerprint = Fingerprint()
+	documents = 0
+	if vectorizer_path:
+		vocabulary, metadata = load_vectorizer(vectorizer_path)
+	elif hashing:
+		vocabulary = np.arange(TIKTOKEN.n_vocab)
+	else:
+		print("document frequencies")
+		df = np.zeros(TIKTOKEN.n_vocab, dtype=np.int64)
+		for batch in batches():
+			tokens = batch_tokens(batch)
+			fingerprint.update(batch.column("title").to_pylist(), tokens)
+			df += np.bincount(token_matrix(tokens).indices, minlength=TIKTOKEN.n_vocab)
+			documents += batch.num_rows
+		# NOTE: Same semantics as CountVectorizer
+		vocabulary = np.flatnonzero(df >= (min_df * documents if min_df < 1 else min_df))
+
+	print("vectorizing")
+	for name in ("X_train", "X_test"):
+		clear_features(folder / name)
+		(folder / name).mkdir(parents=True)
+	rng = np.random.default_rng(0)
+	y_train = []
+	y_test = []
+	for i, batch in enumerate(batches()):
+		tokens = batch_tokens(batch)
+		if hashing and not vectorizer_path:
+			fingerprint.update(batch.column("title").to_pylist(), tokens)
+			documents += batch.num_rows
+		X = token_matrix(tokens)[:, vocabulary]
+		y = batch.column("semicentury").to_numpy()
+		test = rng.random(batch.num_rows) < TEST_SIZE
+		sparse.save_npz(folder / "X_train" / f"{i:05}.npz", X[~test])
+		sparse.save_npz(folder / "X_test" / f"{i:05}.npz", X[test])
+		y_train.append(y[~test])
+		y_test.append(y[test])
+
+	if vectorizer_path:
+		version = metadata["version"]
+	else:
+		path = save_vectorizer(vocabulary, fingerprint.hexdigest(), documents, min_df, hashing)
+		version = path.stem
+		print(f"vectorizer saved to {path}")
+
+	print("to parquet")
+	save_labels("train", np.concatenate(y_train), version)
+	save_labels("test", np.concatenate(y_test), version)
+
+
+def vectorize(
+	input_parquet: Path,
+	semicenturies: list[int] | None = None,
+	qualities: list[int] | None = None,
+	min_df: float = MIN_DF,
+	vectorizer_path: Path | None = None,
+) -> None:
+	print("reading parquet")
+	lf = scan_dataset(input_parquet)
+	if semicenturies:
+		lf = lf.filter(pl.col("semicentury").is_in(semicenturies))
+	if qualities:
+		lf = lf.filter(pl.col("quality").is_in(qualities))
+	if "tokens" in lf.collect_schema():
+		data = lf.select("title", "tokens", "semicentury").collect()
+		tokens = data["tokens"].to_arrow()
+	else:
+		data = lf.select("title", "text", "semicentury").collect()
+		print("tokenizing")
+		tokens = encode(data["text"].to_list())
+	cats = data["semicentury"].to_pandas()
+
+	# NOTE: Straight from the Arrow offsets & values (as in vectorize_chunked), token ids never become Python ints
 	print("vectorizing")
-	X = vectorizer.fit_transform(texts)
+	X = token_matrix(tokens)
+	if vectorizer_path:
+		vocabulary, metadata = load_vectorizer(vectorizer_path)
+		version = metadata["version"]
+	else:
+		# NOTE: Same semantics as CountVectorizer
+		df = np.bincount(X.indices, minlength=TIKTOKEN.n_vocab)
+		vocabulary = np.flatnonzero(df >= (min_df * len(tokens) if min_df < 1 else min_df))
 
-	# data_frame = pd.DataFrame(X.toarray(), columns=vectorizer.get_feature_names_out())
-	columns = [TIKTOKEN.decode([m]) for m in vectorizer.get_feature_names_out()]
-	columns = vectorizer.get_feature_names_out()
+		fingerprint = Fingerprint()
+		fingerprint.update(data["title"].to_list(), tokens)
+		path = save_vectorizer(vocabulary, fingerprint.hexdigest(), len(tokens), min_df, hashing=False)
+		version = path.stem
+		print(f"vectorizer saved to {path}")
+	X = X[:, vocabulary]
 
 	print("to train/test")
-	X_train, X_test, y_train, y_test = train_test_split(X, cats, test_size=0.2, random_state=0)
+	X_train, X_test, y_train, y_test = train_test_split(X, cats, test_size=TEST_SIZE, random_state=0)
 
-	print("to parquet")
-	pd.DataFrame(X_train.toarray(), columns=columns).to_parquet(
-		f"{folder}/X_train.parquet", index=False, compression="zstd"
-	)
-	pd.DataFrame(X_test.toarray(), columns=columns).to_parquet(
-		f"{folder}/X_test.parquet", index=False, compression="zstd"
-	)
-	pd.DataFrame(y_train, columns=["semicentury"]).to_parquet(
-		f"{folder}/y_train.parquet", index=False, compression="zstd"
-	)
-	pd.DataFrame(y_test, columns=["semicentury"]).to_parquet(f"{folder}/y_test.parquet", index=False, compression="zstd")
+	print("to npz")
+	save_features("X_train", X_train.tocsr())
+	save_features("X_test", X_test.tocsr())
+	save_labels("train", y_train.to_numpy(), version)
+	save_labels("test", y_test.to_numpy(), version)
+
+
+@app.command()
+def main(
+	input_parquet: Path,
+	semicentury: Annotated[list[int] | None, typer.Option()] = None,
+	quality: Annotated[list[int] | None, typer.Option()] = None,
+	min_df: float = MIN_DF,
+	chunked: bool = False,
+	hashing: bool = False,
+	batch_size: int = BATCH_SIZE,
+	vectorizer: Path | None = None,
+) -> None:
+	if chunked:
+		vectorize_chunked(input_parquet, semicentury, quality, min_df, hashing, batch_size, vectorizer)
+	else:
+		vectorize(input_parquet, semicentury, quality, min_df, vectorizer)
 
 
 @app.command()
-def main(input_parquet: Path) -> None:
-	vectorize(input_parquet)
+def transform(
+	input_parquet: Path,
+	output_path: Path | None = None,
+	vectorizer: Path = VECTORIZER_PATH,
+	batch_size: int = BATCH_SIZE,
+) -> None:
+	"""
+	Vectorize any dataset w/ a fitted vectorizer (no fitting involved), into CSR shards
+	(00000.npz, ...), along w/ the title (& semicentury, if any) of every row (rows.parquet)
+	"""
+
+	output_path = output_path or features_path(input_parquet)
+	vocabulary, metadata = load_vectorizer(vectorizer)
+	print(f"transforming {input_parquet} w/ vectorizer {metadata['version']}")
+
+	shutil.rmtree(output_path, ignore_errors=True)
+	output_path.mkdir(parents=True)
+	rows = []
+	for i, batch in enumerate(read_batches(input_parquet, doc_columns(input_parquet), batch_size)):
+		X = token_matrix(batch_tokens(batch))[:, vocabulary]
+		sparse.save_npz(output_path / f"{i:05}.npz", X)
+		rows.append(batch.drop_columns([name for name in ("tokens", "text") if name in batch.schema.names]))
+
+	table = pa.Table.from_batches(rows) if rows else pa.table({"title": pa.array([], pa.string())})
+	pq.write_table(
+		table.replace_schema_metadata({"vectorizer": metadata["version"]}),
+		output_path / "rows.parquet",
+		compression="zstd",
+	)
+	print(f"{table.num_rows} rows written to {output_path}")
 
 
 if __name__ == "__main__":
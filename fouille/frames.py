@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+#
+# Seekable container for the legacy marshalled xmltodict pages (c.f., data/make_dataset.sh):
+# independently compressed zstd frames of FRAME_SIZE pages each, along with a sidecar index
+# of frame offsets, sizes, page counts, and first & last titles.
+# NOTE: Frames are plain zstd frames, so the container is still a valid zstd stream (e.g., for zstdcat).
+#
+
+from collections.abc import Iterator
+from io import BufferedReader, BytesIO
+import marshal
+from pathlib import Path
+import sys
+from typing import BinaryIO
+
+from loguru import logger
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rich.pretty import pprint
+from tqdm import tqdm
+import typer
+import zstandard as zstd
+
+from fouille.config import RAW_DATA_DIR
+
+app = typer.Typer()
+
+FRAMED_DUMP_PATH = RAW_DATA_DIR / "frwikisource-current.dicts.zst"
+
+# Pages per frame
+FRAME_SIZE = 1024
+COMPRESSION_LEVEL = 3
+
+INDEX_SCHEMA = pa.schema(
+	[
+		("offset", pa.int64()),
+		("size", pa.int64()),
+		("pages", pa.int64()),
+		("first_title", pa.string()),
+		("last_title", pa.string()),
+	]
+)
+
+
+def index_path(path: Path) -> Path:
+	"""
+	Path of the sidecar index of a framed dump
+	"""
+
+	return path.with_name(path.name + ".idx.parquet")
+
+
+def read_index(path: Path) -> list[dict]:
+	"""
+	Load the sidecar index of a framed dump, one dict per frame
+	"""
+
+	return pq.read_table(index_path(path)).to_pylist()
+
+
+def item_gen(f: BinaryIO) -> Iterator[tuple]:
+	"""
+	Unmarshal xmltodict (path, item) tuples, one by one (generator)
+	"""
+
+	try:
+		while True:
+			yield marshal.load(f)
+	except EOFError:
+		pass
+
+
+def read_frame(fh: BinaryIO, frame: dict) -> bytes:
+	"""
+	Read a single (compressed) frame
+	"""
+
+	fh.seek(frame["offset"])
+	return fh.read(frame["size"])
+
+
+def frame_items(data: bytes) -> Iterator[tuple]:
+	"""
+	Unmarshal the items of a decompressed frame (generator)
+	"""
+
+	return item_gen(BytesIO(data))
+
+
+def item_title(item: tuple) -> str | None:
+	_, page = item
+	return page.get("title") if isinstance(page, dict) else None
+
+
+def pack(f: BinaryIO, output_path: Path, frame_size: int = FRAME_SIZE, level: int = COMPRESSION_LEVEL) -> int:
+	"""
+	Pack a stream of marshalled items into independently compressed frames of frame_size items,
+	and write the sidecar index. Returns the amount of frames written.
+	"""
+
+	cctx = zstd.ZstdCompressor(level=level)
+	frames = []
+	items = []
+
+	def flush(out: BinaryIO) -> None:
+		frame = cctx.compress(b"".join(marshal.dumps(item) for item in items))
+		frames.append(
+			{
+				"offset": out.tell(),
+				"size": len(frame),
+				"pages": len(items),
+				"first_title": item_title(items[0]),
+				"last_title": item_title(items[-1]),
+			}
+		)
+		out.write(frame)
+		items.clear()
+
+	with open(output_path, "wb") as out:
+		for item in tqdm(item_gen(f), unit=" pages"):
+			items.append(item)
+			if len(items) >= frame_size:
+				flush(out)
+		if items:
+			flush(out)
+
+	pq.write_table(pa.Table.from_pylist(frames, schema=INDEX_SCHEMA), index_path(output_path))
+	return len(frames)
+
+
+@app.command("pack")
+def pack_command(
+	input_path: str, output_path: Path = FRAMED_DUMP_PATH, frame_size: int = FRAME_SIZE, level: int = COMPRESSION_LEVEL
+) -> None:
+	"""
+	Convert raw marshalled items ("-" for stdin, e.g., straight from xmltodict) or a plain .zst stream of them
+	"""
+
+	if input_path != "-" and Path(input_path).resolve() == output_path.resolve():
+		raise typer.BadParameter("Cannot pack a dump in place")
+
+	logger.info(f"Packing {input_path} in frames of {frame_size} pages...")
+	if input_path == "-":
+		count = pack(sys.stdin.buffer, output_path, frame_size, level)
+	else:
+		with open(input_path, "rb") as fh:
+			reader = zstd.ZstdDecompressor().stream_reader(fh, read_across_frames=True)
+			# NOTE: marshal.load does lots of tiny (and some empty) reads, which zstandard doesn't like
+			count = pack(BufferedReader(reader), output_path, frame_size, level)
+	logger.success(f"Wrote {count} frames to {output_path}")
+
+
+@app.command()
+def show(
+	path: Path = FRAMED_DUMP_PATH,
+	page: int | None = None,
+	title: str | None = None,
+) -> None:
+	"""
+	Dump a single page, by position in the dump, or by title
+	"""
+
+	frames = read_index(path)
+	dctx = zstd.ZstdDecompressor()
+	with open(path, "rb") as fh:
+		if page is not None:
+			# Jump straight to the right frame
+			for frame in frames:
+				if page < frame["pages"]:
+					items = list(frame_items(dctx.decompress(read_frame(fh, frame))))
+					pprint(items[page])
+					return
+				page -= frame["pages"]
+			raise typer.BadParameter("page is out of range")
+
+		if title is None:
+			raise typer.BadParameter("Either page or title is required")
+
+		# Titles aren't sorted, so we have to look at every frame, but we only unmarshal the ones that may match
+		needle = title.encode()
+		for frame in tqdm(frames, unit=" frames"):
+			data = dctx.decompress(read_frame(fh, frame))
+			if needle not in data:
+				continue
+			for item in frame_items(data):
+				if item_title(item) == title:
+					pprint(item)
+					return
+		raise typer.BadParameter(f"No page titled {title}")
+
+
+if __name__ == "__main__":
+	app()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+#
+# Stream a MediaWiki XML dump straight into a columnar page table.
+# Replaces the xmltodict | marshal | zstd pipeline (and its ~24GB of RAM):
+# we only keep the handful of fields data/extract_data.py actually looks at,
+# and memory usage is bounded by the batch size.
+#
+
+import bz2
+from collections.abc import Iterator
+from pathlib import Path
+import sys
+from typing import BinaryIO
+import xml.etree.ElementTree as ET
+
+from loguru import logger
+import pyarrow as pa
+import pyarrow.parquet as pq
+from tqdm import tqdm
+import typer
+
+from fouille.config import RAW_PAGES_DATASET
+
+app = typer.Typer()
+
+# NOTE: Flat version of what page_extract used to dig out of the xmltodict page dicts
+PAGES_SCHEMA = pa.schema(
+	[
+		("title", pa.string()),
+		("ns", pa.int32()),
+		("model", pa.string()),
+		("format", pa.string()),
+		("text", pa.large_string()),
+		("revision_id", pa.int64()),
+		("sha1", pa.string()),
+	]
+)
+
+# Pages per batch (and per row group)
+BATCH_SIZE = 8192
+
+
+def local_name(tag: str) -> str:
+	"""
+	Strip the XML namespace from an element tag
+	"""
+
+	return tag.rpartition("}")[2]
+
+
+def open_dump(path: str) -> BinaryIO:
+	"""
+	Open the dump (or stdin, given "-"), transparently handling bzip2 compression
+	"""
+
+	fh = sys.stdin.buffer if path == "-" else open(path, "rb")
+	if fh.peek(3)[:3] == b"BZh":
+		return bz2.open(fh)
+	return fh
+
+
+def page_record(elem: ET.Element) -> dict:
+	"""
+	Flatten a page element into a record matching PAGES_SCHEMA
+	"""
+
+	record = dict.fromkeys(PAGES_SCHEMA.names)
+	for child in elem:
+		tag = local_name(child.tag)
+		if tag == "title":
+			record["title"] = child.text
+		elif tag == "ns":
+			record["ns"] = int(child.text)
+		elif tag == "revision":
+			for field in child:
+				tag = local_name(field.tag)
+				if tag == "id":
+					record["revision_id"] = int(field.text)
+				elif tag in ("model", "format", "sha1", "text"):
+					# NOTE: text is None for deleted or empty revisions
+					record[tag] = field.text
+	return record
+
+
+def iter_pages(fh: BinaryIO) -> Iterator[dict]:
+	"""
+	Incrementally parse the dump, yielding one flat record per page (generator)
+	"""
+
+	context = ET.iterparse(fh, events=("start", "end"))
+	# Grab the root element, so we can drop the pages we're done with
+	_, root = next(context)
+	for event, elem in context:
+		if event != "end" or local_name(elem.tag) != "page":
+			continue
+
+		yield page_record(elem)
+		# Pages are direct children of the root, so this keeps the tree (nearly) empty
+		root.clear()
+
+
+def ingest(input_path: str, output_path: Path, batch_size: int = BATCH_SIZE) -> int:
+	"""
+	Dump the page records to a zstd compressed parquet file, batch_size rows at a time.
+	Returns the amount of pages written.
+	"""
+
+	count = 0
+	batch = []
+	with open_dump(input_path) as fh, pq.ParquetWriter(output_path, PAGES_SCHEMA, compression="zstd") as writer:
+		for record in tqdm(iter_pages(fh), unit=" pages"):
+			batch.append(record)
+			if len(batch) >= batch_size:
+				writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=PAGES_SCHEMA))
+				count += len(batch)
+				batch.clear()
+		if batch:
+			writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=PAGES_SCHEMA))
+			count += len(batch)
+	return count
+
+
+@app.command()
+def main(input_path: str, output_path: Path = RAW_PAGES_DATASET, batch_size: int = BATCH_SIZE) -> None:
+	logger.info(f"Ingesting pages from {input_path}...")
+	count = ingest(input_path, output_path, batch_size)
+	logger.success(f"Wrote {count} pages to {output_path}")
+
+
+if __name__ == "__main__":
+	app()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+#
+# Lightweight instrumentation for hot paths: counters & per-stage timings, dumped as JSON.
+# NOTE: When disabled, count() returns right away, and timed() hands out a shared no-op context manager,
+#       so it's fine to leave the calls in per-page code.
+#
+
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+import json
+from pathlib import Path
+import threading
+from time import perf_counter
+from typing import ContextManager
+
+NULL_TIMER = nullcontext()
+
+
+class Timer:
+	"""
+	Accumulate the time spent in a stage, *excluding* the time spent in nested stages
+	(e.g., plain text conversion isn't counted twice as part of the parse stage).
+	NOTE: Nesting is tracked per thread, so stages can run on background threads, too
+	      (as long as threads don't share stages or counters).
+	"""
+
+	__slots__ = ("stats", "stage", "parent", "start", "nested")
+
+	def __init__(self, stats: "Stats", stage: str) -> None:
+		self.stats = stats
+		self.stage = stage
+
+	def __enter__(self) -> "Timer":
+		local = self.stats.local
+		self.parent = getattr(local, "current", None)
+		local.current = self
+		self.nested = 0.0
+		self.start = perf_counter()
+		return self
+
+	def __exit__(self, *exc) -> None:
+		elapsed = perf_counter() - self.start
+		self.stats.timings[self.stage] += elapsed - self.nested
+		self.stats.local.current = self.parent
+		if self.parent is not None:
+			self.parent.nested += elapsed
+
+
+class Stats:
+	"""
+	Counters & stage timings.
+	Worker processes can ship what they gathered back to the parent via take & merge.
+	"""
+
+	def __init__(self, enabled: bool = False) -> None:
+		self.enabled = enabled
+		self.counters = Counter()
+		self.timings = defaultdict(float)
+		self.local = threading.local()
+		self.start = perf_counter()
+
+	def count(self, key: str, n: int = 1) -> None:
+		if self.enabled:
+			self.counters[key] += n
+
+	def timed(self, stage: str) -> ContextManager:
+		if not self.enabled:
+			return NULL_TIMER
+		return Timer(self, stage)
+
+	def take(self) -> dict:
+		"""
+		Return (and reset) the counters & timings gathered so far
+		"""
+
+		data = {"counters": dict(self.counters), "timings": dict(self.timings)}
+		self.counters.clear()
+		self.timings.clear()
+		return data
+
+	def merge(self, data: dict) -> None:
+		"""
+		Merge counters & timings from take (e.g., from a worker process)
+		"""
+
+		self.counters.update(data["counters"])
+		for stage, seconds in data["timings"].items():
+			self.timings[stage] += seconds
+
+	def summary(self) -> dict:
+		"""
+		Snapshot of everything gathered so far, w/ the elapsed wall-clock time
+		"""
+
+		return {
+			"elapsed": perf_counter() - self.start,
+			"counters": dict(sorted(self.counters.items())),
+			"timings": {stage: round(seconds, 6) for stage, seconds in sorted(self.timings.items())},
+		}
+
+
+def dump_json(data: dict, path: Path, append: bool = False) -> None:
+	"""
+	Dump data as JSON (or append it as a single line, e.g., for periodic samples)
+	"""
+
+	with path.open("a" if append else "w") as f:
+		json.dump(data, f, ensure_ascii=False, indent=None if append else "\t")
+		f.write("\n")
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+#
+# Confidence-gated cascade of saved models (c.f., models.py): a cheap model (e.g., Naive Bayes) answers whenever
+# its top-class probability clears a threshold, and only the documents it's unsure about go to an expensive one
+# (e.g., the MLP). The threshold is tuned on the dev split, as the lowest one that still meets a target accuracy,
+# which also makes up for the cheap model's (usually poorly calibrated) probabilities.
+#
+
+from collections.abc import Iterator
+from datetime import datetime, timezone
+import json
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import typer
+
+from fouille.config import DEV_DATASET, MODELS_DIR, TEST_DATASET
+from fouille.features import BATCH_SIZE, batch_tokens, doc_columns
+from fouille.instrument import Stats
+from fouille.modeling.models import load_model, predict_matrix, vectorize_batch
+from fouille.tokens import read_batches
+
+app = typer.Typer()
+
+CASCADE_PATH = MODELS_DIR / "cascade.json"
+
+# Accuracy the cascade may lose w.r.t. the expensive model alone, when no target accuracy is given
+MAX_LOSS = 0.005
+
+
+def token_batches(path: Path, batch_size: int, stats: Stats) -> Iterator[tuple[pa.RecordBatch, np.ndarray]]:
+	"""
+	Stream (token ids, gold labels) batches of a processed dataset (generator)
+	NOTE: Documents are tokenized once, whatever the amount of models they go through
+	"""
+
+	for batch in read_batches(path, doc_columns(path), batch_size):
+		with stats.timed("tokenize"):
+			tokens = pa.record_batch([batch_tokens(batch)], names=["tokens"])
+		yield tokens, batch.column("semicentury").to_numpy()
+
+
+def run_model(bundle: dict, tokens: pa.RecordBatch, stats: Stats, stage: str) -> tuple[np.ndarray, np.ndarray | None]:
+	with stats.timed(stage):
+		y_pred, proba = predict_matrix(bundle, vectorize_batch(bundle, tokens))
+	stats.count(stage, tokens.num_rows)
+	return y_pred, proba
+
+
+def confidence(bundle: dict, proba: np.ndarray | None) -> np.ndarray:
+	if proba is None:
+		raise typer.BadParameter(f"{bundle['name']} has no probabilities, it can't be the first stage of a cascade")
+	return proba.max(axis=1)
+
+
+def tune_threshold(
+	conf: np.ndarray, cheap_correct: np.ndarray, expensive_correct: np.ndarray, target: float
+) -> tuple[float, float, float]:
+	"""
+	Lowest threshold (i.e., most documents answered by the cheap model) whose accuracy meets the target.
+	Returns the threshold, the resulting accuracy, and the share of documents the cheap model answers.
+	"""
+
+	n = len(conf)
+	order = np.argsort(-conf, kind="stable")
+	conf = conf[order]
+	# Accuracy when the cheap model answers the k most confident documents, for every k
+	cheap = np.concatenate([[0], np.cumsum(cheap_correct[order])])
+	expensive = np.concatenate([[0], np.cumsum(expensive_correct[order])])
+	accuracy = (cheap + expensive[-1] - expensive) / n
+	# NOTE: Thresholds can't split ties, so only k's at the boundary between two confidence values are valid
+	valid = np.concatenate([[True], conf[:-1] != conf[1:], [True]])
+	candidates = np.flatnonzero(valid & (accuracy >= target))
+	if not len(candidates):
+		return np.inf, accuracy[0], 0.0
+	k = candidates[-1]
+	return (float(conf[k - 1]) if k else np.inf), float(accuracy[k]), k / n
+
+
+@app.command()
+def tune(
+	cheap: str = "nb",
+	expensive: str = "mlp",
+	dev_path: Path = DEV_DATASET,
+	target_accuracy: float | None = None,
+	max_loss: float = MAX_LOSS,
+	batch_size: int = BATCH_SIZE,
+) -> None:
+	"""
+	Tune the confidence threshold of a cascade on the dev split, for a target accuracy
+	(by default, the accuracy of the expensive model alone, minus max_loss)
+	"""
+
+	stats = Stats(enabled=True)
+	cheap_bundle, expensive_bundle = load_model(cheap), load_model(expensive)
+
+	y_dev, conf, cheap_pred, expensive_pred = [], [], [], []
+	for tokens, y in token_batches(dev_path, batch_size, stats):
+		y_pred, proba = run_model(cheap_bundle, tokens, stats, "cheap")
+		conf.append(confidence(cheap_bundle, proba))
+		cheap_pred.append(y_pred)
+		expensive_pred.append(run_model(expensive_bundle, tokens, stats, "expensive")[0])
+		y_dev.append(y)
+	y_dev, conf = np.concatenate(y_dev), np.concatenate(conf)
+	cheap_correct = np.concatenate(cheap_pred) == y_dev
+	expensive_correct = np.concatenate(expensive_pred) == y_dev
+
+	print(f"{cheap_bundle['name']} dev accuracy: {cheap_correct.mean():.4f}")
+	print(f"{expensive_bundle['name']} dev accuracy: {expensive_correct.mean():.4f}")
+	target = target_accuracy if target_accuracy is not None else expensive_correct.mean() - max_loss
+	threshold, accuracy, coverage = tune_threshold(conf, cheap_correct, expensive_correct, target)
+	if accuracy < target:
+		print(f"no threshold meets {target:.4f}, everything goes to {expensive_bundle['name']}")
+	print(
+		f"threshold: {threshold:.6f}, cascade dev accuracy: {accuracy:.4f} ({coverage:.1%} answered by the cheap model)"
+	)
+
+	MODELS_DIR.mkdir(parents=True, exist_ok=True)
+	with CASCADE_PATH.open("w") as f:
+		json.dump(
+			{
+				"cheap": cheap,
+				"expensive": expensive,
+				# NOTE: JSON has no infinity, and no probability is ever above 1
+				"threshold": min(threshold, 2.0),
+				"target": target,
+				"accuracy": accuracy,
+				"coverage": coverage,
+				"documents": len(y_dev),
+				"tuned": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+			},
+			f,
+			indent="\t",
+		)
+	print(f"cascade saved to {CASCADE_PATH}")
+
+
+@app.command()
+def evaluate(
+	test_path: Path = TEST_DATASET,
+	batch_size: int = BATCH_SIZE,
+	compare: bool = False,
+) -> None:
+	"""
+	Run the tuned cascade over a labelled split, w/ per-stage throughput
+	(and, w/ compare, the expensive model alone over every document, for reference)
+	"""
+
+	if not CASCADE_PATH.exists():
+		raise typer.BadParameter(f"No cascade in {MODELS_DIR}, run tune first")
+	with CASCADE_PATH.open() as f:
+		cascade = json.load(f)
+	cheap_bundle, expensive_bundle = load_model(cascade["cheap"]), load_model(cascade["expensive"])
+
+	stats = Stats(enabled=True)
+	y_test, y_cascade, y_expensive = [], [], []
+	for tokens, y in token_batches(test_path, batch_size, stats):
+		y_pred, proba = run_model(cheap_bundle, tokens, stats, "cheap")
+		unsure = np.flatnonzero(confidence(cheap_bundle, proba) < cascade["threshold"])
+		if len(unsure):
+			y_pred = y_pred.copy()
+			y_pred[unsure] = run_model(expensive_bundle, tokens.take(pa.array(unsure)), stats, "expensive")[0]
+		if compare:
+			y_expensive.append(run_model(expensive_bundle, tokens, stats, "reference")[0])
+		y_cascade.append(y_pred)
+		y_test.append(y)
+	y_test = np.concatenate(y_test)
+
+	summary = stats.summary()
+	counters, timings = summary["counters"], summary["timings"]
+	print(f"cascade accuracy: {(np.concatenate(y_cascade) == y_test).mean():.4f} (dev: {cascade['accuracy']:.4f})")
+	print(
+		f"{counters.get('expensive', 0) / len(y_test):.1%} of {len(y_test)} documents went to {expensive_bundle['name']}"
+	)
+	for stage, name in (("cheap", cheap_bundle["name"]), ("expensive", expensive_bundle["name"])):
+		docs, seconds = counters.get(stage, 0), timings.get(stage, 0.0)
+		print(f"{stage} stage ({name}): {docs} docs in {seconds:.2f}s ({docs / max(seconds, 1e-9):.0f} docs/s)")
+	cost = timings.get("cheap", 0.0) + timings.get("expensive", 0.0)
+	print(
+		f"cascade: {len(y_test) / max(cost, 1e-9):.0f} docs/s (excluding {timings.get('tokenize', 0.0):.2f}s of tokenization)"
+	)
+
+	if compare:
+		print(f"{expensive_bundle['name']} alone accuracy: {(np.concatenate(y_expensive) == y_test).mean():.4f}")
+		print(f"{expensive_bundle['name']} alone: {len(y_test) / max(timings['reference'], 1e-9):.0f} docs/s")
+
+
+if __name__ == "__main__":
+	app()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+#
+# Load generator for the dating service (c.f., serve.py): concurrent clients, each w/ its own keep-alive connection,
+# send documents from a processed dataset (or JSONL) as fast as they get answers, then client side latencies
+# & throughput are reported, along w/ the service's own counters.
+# NOTE: Only needs the standard library & pyarrow, so that it doesn't compete w/ the service for the CPU at startup.
+#
+
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+from pathlib import Path
+import socket as sockets
+from time import perf_counter
+
+import numpy as np
+import pyarrow.dataset as ds
+import typer
+
+from fouille.config import DEV_DATASET, SERVICE_HOST, SERVICE_PORT
+
+app = typer.Typer()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+	def __init__(self, path: Path) -> None:
+		super().__init__("localhost")
+		self.socket_path = path
+
+	def connect(self) -> None:
+		self.sock = sockets.socket(sockets.AF_UNIX, sockets.SOCK_STREAM)
+		self.sock.connect(str(self.socket_path))
+
+
+def connect(host: str, port: int, socket: Path | None) -> http.client.HTTPConnection:
+	return UnixHTTPConnection(socket) if socket else http.client.HTTPConnection(host, port)
+
+
+def call(conn: http.client.HTTPConnection, method: str, path: str, data: dict | None = None) -> dict:
+	body = json.dumps(data).encode() if data is not None else None
+	conn.request(method, path, body=body, headers={"Content-Type": "application/json"})
+	response = conn.getresponse()
+	payload = json.loads(response.read())
+	if response.status != 200:
+		raise RuntimeError(f"{method} {path}: {response.status} {payload.get('error')}")
+	return payload
+
+
+def load_texts(path: Path, limit: int) -> list[str]:
+	"""
+	Up to limit documents, from a processed dataset (partitioned or not), or JSONL ({"text": ...} per line)
+	"""
+
+	if path.suffix == ".jsonl":
+		texts = []
+		with path.open() as f:
+			for line in f:
+				if line.strip():
+					texts.append(json.loads(line)["text"])
+				if len(texts) >= limit:
+					break
+		return texts
+	dataset = ds.dataset(path, format="parquet", partitioning="hive" if path.is_dir() else None)
+	return dataset.head(limit, columns=["text"]).column("text").to_pylist()
+
+
+@app.command()
+def main(
+	input_path: Path = DEV_DATASET,
+	host: str = SERVICE_HOST,
+	port: int = SERVICE_PORT,
+	socket: Path | None = None,
+	clients: int = 8,
+	requests: int = 1000,
+	docs_per_request: int = 1,
+	limit: int = 1000,
+) -> None:
+	"""
+	Hammer the dating service w/ requests (of docs_per_request documents each) from concurrent clients
+	"""
+
+	texts = load_texts(input_path, limit)
+	if not texts:
+		raise typer.BadParameter(f"No documents in {input_path}")
+	payloads = [
+		{"texts": [texts[(i * docs_per_request + j) % len(texts)] for j in range(docs_per_request)]}
+		for i in range(requests)
+	]
+
+	def client(worker: int) -> list[float]:
+		conn = connect(host, port, socket)
+		latencies = []
+		for payload in payloads[worker::clients]:
+			start = perf_counter()
+			call(conn, "POST", "/predict", payload)
+			latencies.append(perf_counter() - start)
+		conn.close()
+		return latencies
+
+	start = perf_counter()
+	with ThreadPoolExecutor(max_workers=clients) as executor:
+		latencies = np.concatenate([np.array(result) for result in executor.map(client, range(clients))]) * 1000
+	elapsed = perf_counter() - start
+
+	print(f"{requests} requests ({requests * docs_per_request} docs) from {clients} clients in {elapsed:.2f}s")
+	print(f"client latency: p50 {np.percentile(latencies, 50):.2f}ms, p99 {np.percentile(latencies, 99):.2f}ms")
+	print(f"throughput: {requests / elapsed:.0f} requests/s, {requests * docs_per_request / elapsed:.0f} docs/s")
+
+	conn = connect(host, port, socket)
+	print(json.dumps(call(conn, "GET", "/stats"), indent="\t"))
+	conn.close()
+
+
+if __name__ == "__main__":
+	app()
@@ -1,105 +1,466 @@
 #!/usr/bin/env python3
+#
+# Train & evaluate every registered model, concurrently: each model gets its own worker process, and a thread budget
+# (so BLAS & co. don't oversubscribe the machine), and workers share a single memory-mapped copy of the features.
+# The stream command trains linear models incrementally instead (partial_fit), one feature shard at a time,
+# so memory usage doesn't depend on the size of the training set.
+# Fitted models are saved to MODELS_DIR, along w/ their vocabulary & label set (uncompressed, so that large arrays
+# get memory mapped when loaded), for the predict command to date new texts w/o any retraining.
+#
 
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from functools import partial
+import json
+import os
+from pathlib import Path
+import tempfile
+from time import perf_counter
+from typing import Annotated
 
+import joblib
+import numpy as np
 import pandas as pd
-from sklearn import naive_bayes, neural_network, svm, tree
+import pyarrow as pa
+import pyarrow.parquet as pq
+from scipy import sparse
+from sklearn import linear_model, naive_bayes, neural_network, svm, tree
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
+from sklearn.preprocessing import normalize
+from threadpoolctl import threadpool_limits
 import typer
 
-from fouille.config import CONFUSION_DIR, PROCESSED_DATA_DIR
+from fouille.config import CONFUSION_DIR, MODELS_DIR, PROCESSED_DATA_DIR, VECTORIZERS_DIR
+from fouille.features import (
+	BATCH_SIZE,
+	batch_tokens,
+	doc_columns,
+	features_vectorizer,
+	load_features,
+	load_vectorizer,
+	shard_paths,
+	token_matrix,
+)
+from fouille.tokens import read_batches
 
 app = typer.Typer()
 
+LABELS = [1450, 1500, 1550, 1600, 1650, 1700, 1750, 1800, 1850, 1900, 1950, 2000]
 
-def train_and_predict() -> None:
+# Model registry: key (used for the confusion matrix CSV), display name, constructor, and thread budget
+# NOTE: A budget of None means whatever cores the other models leave
+MODELS = {
+	"clf": ("DecisionTree", tree.DecisionTreeClassifier, 1),
+	"svm": ("SVM", svm.SVC, 1),
+	"nb": ("Naive Bayes", naive_bayes.MultinomialNB, 1),
+	"mlp": (
+		"MLP",
+		partial(neural_network.MLPClassifier, alpha=1e-5, hidden_layer_sizes=(100, 100), random_state=1),
+		None,
+	),
+}
+
+# Models that can learn incrementally: key, display name, constructor, and whether rows should be L2 normalized
+# NOTE: Keys are shared w/ MODELS for saved models & confusion matrices, so they must not collide.
+#       Naive Bayes only needs a single pass (more epochs would just count everything again)
+STREAMING_MODELS = {
+	"sgd_svm": (
+		"Linear SVM (SGD)",
+		partial(linear_model.SGDClassifier, loss="hinge", alpha=1e-6, random_state=1),
+		True,
+	),
+	"sgd_logreg": (
+		"Logistic regression (SGD)",
+		partial(linear_model.SGDClassifier, loss="log_loss", alpha=1e-6, random_state=1),
+		True,
+	),
+	"stream_nb": ("Naive Bayes (streaming)", naive_bayes.MultinomialNB, False),
+}
+if set(MODELS) & set(STREAMING_MODELS):
+	raise ValueError(f"Model keys used by both registries: {', '.join(sorted(set(MODELS) & set(STREAMING_MODELS)))}")
+EPOCHS = 5
+# Shards pooled (& shuffled together) at a time while training (c.f., shard_batches)
+# NOTE: Shards of a partitioned dataset each hold a single semicentury, so shuffling them one at a time isn't enough
+SHUFFLE_SHARDS = 16
+
+# Per worker process (c.f., init_worker)
+DATA = {}
+
+
+def model_path(key: str) -> Path:
+	return MODELS_DIR / f"{key}.joblib"
+
+
+def fitted_vectorizer(features_path: Path) -> tuple[np.ndarray, dict]:
+	"""
+	Vocabulary & metadata of the vectorizer a feature matrix was made with (c.f., features.py)
+	"""
+
+	version = features_vectorizer(features_path)
+	path = VECTORIZERS_DIR / f"{version}.parquet"
+	if not path.exists():
+		raise typer.BadParameter(f"Vectorizer {version} (used for {features_path}) is gone, re-run features.py")
+	return load_vectorizer(path)
+
+
+def save_model(key: str, name: str, model: object, vocabulary: np.ndarray, vectorizer: dict, scale: bool) -> Path:
+	"""
+	Save a fitted model, w/ everything needed to make predictions on raw documents.
+	NOTE: Dumped uncompressed, so that predict can map large arrays (e.g., coefficients) rather than read them
+	"""
+
+	MODELS_DIR.mkdir(parents=True, exist_ok=True)
+	path = model_path(key)
+	bundle = {
+		"key": key,
+		"name": name,
+		"model": model,
+		"labels": model.classes_.tolist(),
+		"vocabulary": vocabulary,
+		"vectorizer": vectorizer,
+		"normalize": scale,
+		"trained": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+	}
+	joblib.dump(bundle, path)
+	return path
+
+
+def thread_budgets(keys: list[str]) -> dict[str, int]:
+	"""
+	Threads for each model, so that the whole run uses every core (but no more)
+	"""
+
+	fixed = sum(MODELS[key][2] for key in keys if MODELS[key][2] is not None)
+	flexible = [key for key in keys if MODELS[key][2] is None]
+	spare = max(1, ((os.cpu_count() or 1) - fixed) // max(1, len(flexible)))
+	return {key: MODELS[key][2] or spare for key in keys}
+
+
+def init_worker(data_path: Path) -> None:
+	"""
+	Worker initializer: map the features & labels (shared across workers, read-only)
+	"""
+
+	DATA.update(joblib.load(data_path, mmap_mode="r"))
+
+
+def fit_and_evaluate(key: str, threads: int, vectorizer: dict | None = None) -> dict:
+	"""
+	Train a registered model, and evaluate it on the test set (in a worker).
+	Given the vectorizer behind the features, the fitted model is saved, too.
+	"""
+
+	name, make, _ = MODELS[key]
+	with threadpool_limits(limits=threads):
+		start = perf_counter()
+		model = make().fit(DATA["X_train"], DATA["y_train"])
+		fit_time = perf_counter() - start
+		start = perf_counter()
+		y_pred = model.predict(DATA["X_test"])
+		predict_time = perf_counter() - start
+
+	if vectorizer is not None:
+		save_model(key, name, model, DATA["vocabulary"], vectorizer, scale=False)
+
+	y_test = DATA["y_test"]
+	return {
+		"key": key,
+		"name": name,
+		"threads": threads,
+		"fit": fit_time,
+		"predict": predict_time,
+		"accuracy": accuracy_score(y_test, y_pred),
+		"confusion": confusion_matrix(y_test, y_pred, labels=LABELS),
+		"report": classification_report(y_test, y_pred),
+	}
+
+
+def train_and_predict(keys: list[str], workers: int | None = None, save: bool = True) -> None:
 	folder = PROCESSED_DATA_DIR
 
-	labels = [1450, 1500, 1550, 1600, 1650, 1700, 1750, 1800, 1850, 1900, 1950, 2000]
-
-	print("loading parquet")
-	X_train = pd.read_parquet(f"{folder}/X_train.parquet")
-	X_test = pd.read_parquet(f"{folder}/X_test.parquet")
-	y_train = pd.read_parquet(f"{folder}/y_train.parquet").values.ravel()
-	y_test = pd.read_parquet(f"{folder}/y_test.parquet").values.ravel()
-
-	# Decision tree
-	print("Decisions tree...")
-	clf_train = tree.DecisionTreeClassifier()
-	print("- fit")
-	clf_train = clf_train.fit(X_train, y_train)
-	print("- pred")
-	clf_y_pred = clf_train.predict(X_test)
-
-	# SVM
-	print("SVM...")
-	svm_train = svm.SVC()
-	print("- fit")
-	svm_train = svm_train.fit(X_train, y_train)
-	print("- pred")
-	svm_y_pred = svm_train.predict(X_test)
-
-	# Naive Bayes
-	print("Naive bayes...")
-	nb_train = naive_bayes.MultinomialNB()
-	print("- fit")
-	nb_train = nb_train.fit(X_train, y_train)
-	print("- pred")
-	nb_y_pred = nb_train.predict(X_test)
-
-	# MLP
-	print("Perceptron...")
-	mlp_train = neural_network.MLPClassifier(
-		alpha=1e-5,
-		hidden_layer_sizes=(
-			100,
-			100,
-		),
-		random_state=1,
+	print("loading features")
+	data = {
+		"X_train": load_features("X_train"),
+		"X_test": load_features("X_test"),
+		"y_train": pd.read_parquet(f"{folder}/y_train.parquet").values.ravel(),
+		"y_test": pd.read_parquet(f"{folder}/y_test.parquet").values.ravel(),
+	}
+	vectorizer = None
+	if save:
+		data["vocabulary"], vectorizer = fitted_vectorizer(folder / "X_train")
+
+	budgets = thread_budgets(keys)
+	results = {}
+	with tempfile.TemporaryDirectory(dir=folder) as tmp:
+		# NOTE: Dumped uncompressed, so that the workers can map it rather than each load their own copy
+		data_path = Path(tmp) / "data.joblib"
+		joblib.dump(data, data_path)
+		del data
+
+		start = perf_counter()
+		with ProcessPoolExecutor(
+			max_workers=workers or len(keys), initializer=init_worker, initargs=(data_path,)
+		) as executor:
+			futures = [executor.submit(fit_and_evaluate, key, budgets[key], vectorizer) for key in keys]
+			for future in as_completed(futures):
+				result = future.result()
+				results[result["key"]] = result
+				print(
+					f"{result['name']} done (fit: {result['fit']:.2f}s, pred: {result['predict']:.2f}s,"
+					f" {result['threads']} thread(s))"
+				)
+		elapsed = perf_counter() - start
+
+	for key in keys:
+		print(f"=== {results[key]['name']} Report ===")
+		print(results[key]["report"])
+
+	for key in keys:
+		print(f"{results[key]['name']} accuracy", results[key]["accuracy"])
+	total = sum(result["fit"] + result["predict"] for result in results.values())
+	print(f"Wall time: {elapsed:.2f}s (vs. {total:.2f}s of fitting & predicting)")
+
+	for key in keys:
+		pd.DataFrame(results[key]["confusion"], index=LABELS, columns=LABELS).to_csv(
+			CONFUSION_DIR / f"{key}_confusion.csv"
+		)
+	if save:
+		print(f"models saved to {MODELS_DIR}")
+
+
+def shard_labels(path: Path) -> np.ndarray:
+	"""
+	Labels of a feature matrix: either from a transform (rows.parquet), or from features.py (e.g., y_train.parquet)
+	"""
+
+	if (path / "rows.parquet").exists():
+		return pd.read_parquet(path / "rows.parquet", columns=["semicentury"])["semicentury"].to_numpy()
+	return pd.read_parquet(path.with_name(f"y_{path.name.removeprefix('X_')}.parquet")).values.ravel()
+
+
+def shard_batches(
+	path: Path, rng: np.random.Generator | None = None, shuffle_shards: int = SHUFFLE_SHARDS
+) -> Iterator[tuple[sparse.csr_matrix, np.ndarray]]:
+	"""
+	Stream (X, y) batches, one shard at a time (generator).
+	Given a random generator, shards are shuffled, and pooled (up to shuffle_shards at a time)
+	so that rows get shuffled across shards, rather than just within them.
+	"""
+
+	shards = shard_paths(path)
+	y = shard_labels(path)
+	# NOTE: Only the shapes get loaded here
+	sizes = [int(np.load(shard)["shape"][0]) for shard in shards]
+	offsets = np.concatenate([[0], np.cumsum(sizes)])
+
+	if rng is None:
+		for i in range(len(shards)):
+			if sizes[i]:
+				yield sparse.load_npz(shards[i]).tocsr(), y[offsets[i] : offsets[i + 1]]
+		return
+
+	order = [i for i in rng.permutation(len(shards)) if sizes[i]]
+	# NOTE: Evenly sized pools, so that the last one isn't left w/ a single (i.e., single class) shard
+	for pool in np.array_split(order, -(-len(order) // max(1, shuffle_shards))):
+		X = sparse.vstack([sparse.load_npz(shards[i]) for i in pool], format="csr")
+		y_pool = np.concatenate([y[offsets[i] : offsets[i + 1]] for i in pool])
+		# Still one batch per shard, size-wise
+		for rows in np.array_split(rng.permutation(X.shape[0]), len(pool)):
+			yield X[rows], y_pool[rows]
+
+
+def train_streaming(key: str, train_path: Path, epochs: int, seed: int, shuffle_shards: int = SHUFFLE_SHARDS) -> object:
+	"""
+	Train a streaming model, one shard at a time
+	"""
+
+	name, make, scale = STREAMING_MODELS[key]
+	model = make()
+	rng = np.random.default_rng(seed)
+	for epoch in range(1 if isinstance(model, naive_bayes.MultinomialNB) else epochs):
+		print(f"{name}: epoch {epoch + 1}")
+		for X, y in shard_batches(train_path, rng, shuffle_shards):
+			model.partial_fit(normalize(X) if scale else X, y, classes=LABELS)
+	return model
+
+
+def evaluate_streaming(models: dict[str, object], test_path: Path) -> None:
+	"""
+	Evaluate streaming models, one shard at a time
+	"""
+
+	y_test = []
+	y_preds = {key: [] for key in models}
+	for X, y in shard_batches(test_path):
+		y_test.append(y)
+		for key, model in models.items():
+			y_preds[key].append(model.predict(normalize(X) if STREAMING_MODELS[key][2] else X))
+	y_test = np.concatenate(y_test)
+
+	for key in models:
+		y_pred = np.concatenate(y_preds[key])
+		name = STREAMING_MODELS[key][0]
+		print(f"=== {name} Report ===")
+		print(classification_report(y_test, y_pred))
+		print(f"{name} accuracy", accuracy_score(y_test, y_pred))
+		pd.DataFrame(confusion_matrix(y_test, y_pred, labels=LABELS), index=LABELS, columns=LABELS).to_csv(
+			CONFUSION_DIR / f"{key}_confusion.csv"
+		)
+
+
+@app.command()
+def main(
+	model: Annotated[list[str] | None, typer.Option(help=f"Models to run (default: all of {', '.join(MODELS)})")] = None,
+	workers: int | None = None,
+	save: bool = True,
+) -> None:
+	keys = model or list(MODELS)
+	unknown = set(keys) - set(MODELS)
+	if unknown:
+		raise typer.BadParameter(f"Unknown model(s): {', '.join(sorted(unknown))}")
+	train_and_predict(keys, workers, save)
+
+
+@app.command()
+def stream(
+	model: Annotated[
+		list[str] | None, typer.Option(help=f"Models to run (default: all of {', '.join(STREAMING_MODELS)})")
+	] = None,
+	train_path: Path = PROCESSED_DATA_DIR / "X_train",
+	test_path: Path = PROCESSED_DATA_DIR / "X_test",
+	epochs: int = EPOCHS,
+	seed: int = 42,
+	shuffle_shards: int = SHUFFLE_SHARDS,
+	save: bool = True,
+) -> None:
+	"""
+	Train linear models incrementally over feature shards (e.g., from features.py --chunked, or features.py transform)
+	"""
+
+	keys = model or list(STREAMING_MODELS)
+	unknown = set(keys) - set(STREAMING_MODELS)
+	if unknown:
+		raise typer.BadParameter(f"Unknown model(s): {', '.join(sorted(unknown))}")
+
+	vocabulary, vectorizer = fitted_vectorizer(train_path) if save else (None, None)
+	models = {}
+	for key in keys:
+		start = perf_counter()
+		models[key] = train_streaming(key, train_path, epochs, seed, shuffle_shards)
+		print(f"{STREAMING_MODELS[key][0]} done (fit: {perf_counter() - start:.2f}s)")
+		if save:
+			name, _, scale = STREAMING_MODELS[key]
+			print(f"saved to {save_model(key, name, models[key], vocabulary, vectorizer, scale)}")
+	evaluate_streaming(models, test_path)
+
+
+def load_model(key: str) -> dict:
+	"""
+	Load a saved model (c.f., save_model), w/ its large arrays memory mapped
+	"""
+
+	path = model_path(key)
+	if not path.exists():
+		raise typer.BadParameter(f"No saved model {key} (c.f., {MODELS_DIR})")
+	return joblib.load(path, mmap_mode="r")
+
+
+def vectorize_batch(bundle: dict, batch: pa.RecordBatch) -> sparse.csr_matrix:
+	"""
+	Features of a batch of documents (token ids, or text), as the model saw them during training
+	"""
+
+	X = token_matrix(batch_tokens(batch))[:, bundle["vocabulary"]]
+	return normalize(X) if bundle["normalize"] else X
+
+
+def predict_matrix(bundle: dict, X: sparse.csr_matrix) -> tuple[np.ndarray, np.ndarray | None]:
+	"""
+	Predicted semicenturies, and their probabilities (one column per label, or None if the model has none)
+	"""
+
+	model = bundle["model"]
+	proba = model.predict_proba(X).astype(np.float32) if hasattr(model, "predict_proba") else None
+	return model.predict(X), proba
+
+
+def jsonl_batches(path: Path, batch_size: int) -> Iterator[pa.RecordBatch]:
+	"""
+	Stream a JSONL file of documents ({"title": ..., "text": ...} per line), batch_size rows at a time (generator)
+	"""
+
+	schema = pa.schema([("title", pa.string()), ("text", pa.string())])
+	rows = []
+	with path.open() as f:
+		for line in f:
+			if line.strip():
+				rows.append(json.loads(line))
+			if len(rows) >= batch_size:
+				yield pa.RecordBatch.from_pylist(rows, schema=schema)
+				rows = []
+	if rows:
+		yield pa.RecordBatch.from_pylist(rows, schema=schema)
+
+
+def predictions_schema(labels: list[int]) -> pa.Schema:
+	# NOTE: One probability per label, in the order of the labels stored in the metadata
+	return pa.schema(
+		[
+			("title", pa.string()),
+			("predicted_semicentury", pa.uint16()),
+			("probabilities", pa.list_(pa.float32(), len(labels))),
+		],
+		metadata={"labels": json.dumps(labels)},
 	)
-	print("- fit")
-	mlp_train = mlp_train.fit(X_train, y_train)
-	print("- pred")
-	mlp_y_pred = mlp_train.predict(X_test)
-
-	# Eval
-	clf_accuracy = accuracy_score(y_test, clf_y_pred)
-	svm_accuracy = accuracy_score(y_test, svm_y_pred)
-	nb_accuracy = accuracy_score(y_test, nb_y_pred)
-	mlp_accuracy = accuracy_score(y_test, mlp_y_pred)
-
-	clf_confusion = confusion_matrix(y_test, clf_y_pred, labels=labels)
-	svm_confusion = confusion_matrix(y_test, svm_y_pred, labels=labels)
-	nb_confusion = confusion_matrix(y_test, nb_y_pred, labels=labels)
-	mlp_confusion = confusion_matrix(y_test, mlp_y_pred, labels=labels)
-
-	clf_report = classification_report(y_test, clf_y_pred)
-	svm_report = classification_report(y_test, svm_y_pred)
-	nb_report = classification_report(y_test, nb_y_pred)
-	mlp_report = classification_report(y_test, mlp_y_pred)
-
-	print("=== DecisionTree Report ===")
-	print(clf_report)
-	print("=== SVM Report ===")
-	print(svm_report)
-	print("=== Naive Bayes Report ===")
-	print(nb_report)
-	print("=== MLP Report ===")
-	print(mlp_report)
-
-	print("DecisionTree accuracy", clf_accuracy)
-	print("SVM accuracy", svm_accuracy)
-	print("Naive Bayes accuracy", nb_accuracy)
-	print("MLP accuracy", mlp_accuracy)
-
-	pd.DataFrame(clf_confusion, index=labels, columns=labels).to_csv(CONFUSION_DIR / "clf_confusion.csv")
-	pd.DataFrame(svm_confusion, index=labels, columns=labels).to_csv(CONFUSION_DIR / "svm_confusion.csv")
-	pd.DataFrame(nb_confusion, index=labels, columns=labels).to_csv(CONFUSION_DIR / "nb_confusion.csv")
-	pd.DataFrame(mlp_confusion, index=labels, columns=labels).to_csv(CONFUSION_DIR / "mlp_confusion.csv")
 
 
 @app.command()
-def main() -> None:
-	train_and_predict()
+def predict(
+	input_path: Path,
+	output_path: Path | None = None,
+	model: str = "nb",
+	batch_size: int = BATCH_SIZE,
+) -> None:
+	"""
+	Date documents (a processed dataset, or JSONL) w/ a saved model, batch_size documents at a time.
+	Probabilities are null for models that don't have any (e.g., SVMs).
+	"""
+
+	start = perf_counter()
+	bundle = load_model(model)
+	labels = bundle["labels"]
+	print(f"{bundle['name']} (vectorizer {bundle['vectorizer']['version']}) loaded in {perf_counter() - start:.3f}s")
+
+	if input_path.suffix == ".jsonl":
+		batches = jsonl_batches(input_path, batch_size)
+	else:
+		batches = read_batches(input_path, [c for c in doc_columns(input_path) if c != "semicentury"], batch_size)
+	output_path = output_path or input_path.with_name(input_path.name.split(".")[0] + ".predictions.parquet")
+	schema = predictions_schema(labels)
+
+	count = 0
+	busy = 0.0
+	with pq.ParquetWriter(output_path, schema, compression="zstd") as writer:
+		for i, batch in enumerate(batches):
+			batch_start = perf_counter()
+			y_pred, proba = predict_matrix(bundle, vectorize_batch(bundle, batch))
+			if proba is not None:
+				proba = pa.FixedSizeListArray.from_arrays(proba.ravel(), len(labels))
+			else:
+				proba = pa.nulls(batch.num_rows, schema.field("probabilities").type)
+			elapsed = perf_counter() - batch_start
+			writer.write_batch(
+				pa.record_batch([batch.column("title"), pa.array(y_pred, pa.uint16()), proba], schema=schema)
+			)
+
+			if not i:
+				print(f"cold start: {perf_counter() - start:.3f}s to the first batch")
+			print(f"batch {i}: {batch.num_rows} docs in {elapsed:.3f}s ({batch.num_rows / elapsed:.0f} docs/s)")
+			count += batch.num_rows
+			busy += elapsed
+
+	print(f"{count} predictions written to {output_path} ({count / max(busy, 1e-9):.0f} docs/s overall)")
 
 
 if __name__ == "__main__":
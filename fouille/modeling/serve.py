@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+#
+# Local dating service: a saved model (c.f., models.py) is loaded once, and served over HTTP (TCP or Unix socket),
+# so that other jobs don't have to pay for sklearn, tiktoken & the model on every run.
+# Concurrent requests are coalesced into micro-batches (up to MAX_BATCH documents, or MAX_WAIT seconds),
+# so that vectorizing & predicting happen once per batch rather than once per request.
+#
+# POST /predict {"texts": [...]} -> {"labels": [...], "semicenturies": [...], "probabilities": [[...], ...] | null}
+# GET /stats -> request, document & batch counters, p50/p99 latencies, and throughput
+#
+
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import queue
+import socketserver
+import threading
+from time import perf_counter
+
+from loguru import logger
+import numpy as np
+import pyarrow as pa
+import typer
+
+from fouille.config import SERVICE_HOST, SERVICE_PORT
+from fouille.instrument import Stats
+from fouille.modeling.models import load_model, predict_matrix, vectorize_batch
+
+app = typer.Typer()
+
+# Documents per micro-batch, and how long (in seconds) the first request of a batch may wait for others
+MAX_BATCH = 256
+MAX_WAIT = 0.005
+# Latencies kept for percentiles (i.e., the most recent requests)
+LATENCY_WINDOW = 10_000
+
+
+class Batcher:
+	"""
+	Coalesce concurrent requests into micro-batches, processed one at a time on a single background thread
+	NOTE: Counters & timings are only ever updated from that thread, so they don't need a lock
+	"""
+
+	def __init__(self, bundle: dict, max_batch: int = MAX_BATCH, max_wait: float = MAX_WAIT) -> None:
+		self.bundle = bundle
+		self.max_batch = max_batch
+		self.max_wait = max_wait
+		self.queue = queue.Queue()
+		self.stats = Stats(enabled=True)
+		self.latencies = deque(maxlen=LATENCY_WINDOW)
+		threading.Thread(target=self.run, daemon=True).start()
+
+	def submit(self, texts: list[str]) -> Future:
+		future = Future()
+		self.queue.put((texts, future))
+		return future
+
+	def run(self) -> None:
+		while True:
+			pending = [self.queue.get()]
+			size = len(pending[0][0])
+			deadline = perf_counter() + self.max_wait
+			while size < self.max_batch:
+				timeout = deadline - perf_counter()
+				if timeout <= 0:
+					break
+				try:
+					pending.append(self.queue.get(timeout=timeout))
+				except queue.Empty:
+					break
+				size += len(pending[-1][0])
+			self.process(pending)
+
+	def process(self, pending: list[tuple[list[str], Future]]) -> None:
+		texts = [text for request, _ in pending for text in request]
+		try:
+			with self.stats.timed("transform"):
+				X = vectorize_batch(self.bundle, pa.record_batch([pa.array(texts, pa.string())], names=["text"]))
+			with self.stats.timed("predict"):
+				y_pred, proba = predict_matrix(self.bundle, X)
+		except Exception as e:
+			for _, future in pending:
+				future.set_exception(e)
+			self.stats.count("errors", len(pending))
+			return
+
+		start = 0
+		for request, future in pending:
+			end = start + len(request)
+			future.set_result((y_pred[start:end], None if proba is None else proba[start:end]))
+			start = end
+		self.stats.count("batches")
+		self.stats.count("requests", len(pending))
+		self.stats.count("documents", len(texts))
+
+	def summary(self) -> dict:
+		stats = self.stats.summary()
+		counters = stats["counters"]
+		latencies = np.array(self.latencies) * 1000
+		return {
+			"model": self.bundle["key"],
+			"vectorizer": self.bundle["vectorizer"]["version"],
+			**stats,
+			"mean_batch": counters.get("documents", 0) / max(1, counters.get("batches", 0)),
+			"latency_ms": {
+				"p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+				"p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+			},
+			"throughput": {
+				"requests": counters.get("requests", 0) / stats["elapsed"],
+				"documents": counters.get("documents", 0) / stats["elapsed"],
+			},
+		}
+
+
+class Handler(BaseHTTPRequestHandler):
+	# NOTE: Keep-alive, so that clients don't pay for a new connection on every request,
+	#       and buffered replies (flushed once per request), so that headers & body don't end up
+	#       in separate packets (Nagle's algorithm & delayed ACKs would add ~40ms to every request)
+	protocol_version = "HTTP/1.1"
+	wbufsize = -1
+	batcher: Batcher
+
+	def reply(self, status: int, data: dict) -> None:
+		body = json.dumps(data).encode()
+		self.send_response(status)
+		self.send_header("Content-Type", "application/json")
+		self.send_header("Content-Length", str(len(body)))
+		self.end_headers()
+		self.wfile.write(body)
+
+	def do_GET(self) -> None:
+		if self.path == "/stats":
+			self.reply(200, self.batcher.summary())
+		else:
+			self.reply(404, {"error": f"No such endpoint {self.path}"})
+
+	def do_POST(self) -> None:
+		start = perf_counter()
+		try:
+			length = int(self.headers.get("Content-Length", 0))
+			if length < 0:
+				raise ValueError
+		except ValueError:
+			# NOTE: There's no telling where the body ends, so the connection can't be reused
+			self.close_connection = True
+			self.reply(400, {"error": "Bad request: invalid Content-Length"})
+			return
+		body = self.rfile.read(length)
+		if self.path != "/predict":
+			self.reply(404, {"error": f"No such endpoint {self.path}"})
+			return
+		try:
+			texts = json.loads(body)["texts"]
+			if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+				raise ValueError("texts should be a list of strings")
+		except (KeyError, TypeError, ValueError) as e:
+			self.reply(400, {"error": f"Bad request: {e}"})
+			return
+
+		if not texts:
+			# NOTE: Models can't predict on 0 samples, so don't let an empty request into a batch
+			model = self.batcher.bundle["model"]
+			y_pred = np.empty(0, dtype=np.int64)
+			proba = np.empty((0, len(model.classes_)), dtype=np.float32) if hasattr(model, "predict_proba") else None
+		else:
+			try:
+				y_pred, proba = self.batcher.submit(texts).result()
+			except Exception as e:
+				self.reply(500, {"error": repr(e)})
+				return
+		self.reply(
+			200,
+			{
+				"labels": self.batcher.bundle["labels"],
+				"semicenturies": y_pred.tolist(),
+				"probabilities": None if proba is None else proba.tolist(),
+			},
+		)
+		self.batcher.latencies.append(perf_counter() - start)
+
+	def log_message(self, format: str, *args) -> None:
+		# NOTE: Logging every request would cost more than serving it
+		pass
+
+
+class UnixHTTPServer(socketserver.ThreadingUnixStreamServer):
+	daemon_threads = True
+
+	def get_request(self) -> tuple:
+		# NOTE: BaseHTTPRequestHandler expects a (host, port) client address
+		request, _ = super().get_request()
+		return request, ("unix", 0)
+
+
+@app.command()
+def main(
+	model: str = "nb",
+	host: str = SERVICE_HOST,
+	port: int = SERVICE_PORT,
+	socket: Path | None = None,
+	max_batch: int = MAX_BATCH,
+	max_wait: float = MAX_WAIT,
+) -> None:
+	"""
+	Serve a saved model on localhost (or on a Unix socket), until interrupted
+	"""
+
+	start = perf_counter()
+	bundle = load_model(model)
+	# NOTE: Warm up (i.e., page in the mapped arrays) before the first request comes in
+	predict_matrix(bundle, vectorize_batch(bundle, pa.record_batch([pa.array([""])], names=["text"])))
+	Handler.batcher = Batcher(bundle, max_batch, max_wait)
+	logger.info(f"{bundle['name']} (vectorizer {bundle['vectorizer']['version']}) ready in {perf_counter() - start:.3f}s")
+
+	if socket:
+		socket.unlink(missing_ok=True)
+		server = UnixHTTPServer(str(socket), Handler)
+		logger.info(f"Listening on {socket}")
+	else:
+		server = ThreadingHTTPServer((host, port), Handler)
+		logger.info(f"Listening on http://{host}:{port}")
+	try:
+		server.serve_forever()
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.server_close()
+		if socket:
+			socket.unlink(missing_ok=True)
+		logger.info(json.dumps(Handler.batcher.summary()))
+
+
+if __name__ == "__main__":
+	app()
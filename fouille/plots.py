@@ -16,6 +16,7 @@ from fouille.config import (
 	RAW_CATEGORIES_VIZ,
 	RAW_DATASET,
 )
+from fouille.dataset import scan_dataset
 
 # Let vegafusion trim the embedded data
 # c.f., https://altair-viz.github.io/user_guide/large_datasets.html
@@ -130,7 +131,7 @@ def plot_gold_categories_distribution() -> None:
 
 	logger.info("Generating categorical distribution plot from final data...")
 
-	lf = pl.scan_parquet(FULL_DATASET)
+	lf = scan_dataset(FULL_DATASET)
 
 	distrib = (
 		# We don't need any other columns
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+#
+# Tokenize the processed datasets once and for all: token ids are stored as a List[UInt32] column
+# (next to title & semicentury), so that vectorizers don't have to re-tokenize the corpus on every run.
+# NOTE: tiktoken releases the GIL while encoding, so batches are spread over every core (c.f., encode).
+#
+
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import os
+from pathlib import Path
+from typing import Annotated
+
+from loguru import logger
+import numpy as np
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+import tiktoken as tk
+from tqdm import tqdm
+import typer
+
+from fouille.config import DEV_DATASET, TEST_DATASET, TRAIN_DATASET
+
+app = typer.Typer()
+
+TIKTOKEN = tk.get_encoding("o200k_base")
+
+TOKENS_SCHEMA = pa.schema(
+	[
+		("title", pa.string()),
+		("semicentury", pa.uint16()),
+		# NOTE: Kept for --quality filters (c.f., features.py)
+		("quality", pa.uint8()),
+		("tokens", pa.large_list(pa.uint32())),
+	]
+)
+
+# Documents per batch (and per row group)
+BATCH_SIZE = 4096
+
+
+def tokens_path(path: Path) -> Path:
+	"""
+	Path of the tokenized version of a processed dataset
+	"""
+
+	return path.with_name(path.stem + ".tokens.parquet")
+
+
+def read_batches(
+	path: Path, columns: list[str], batch_size: int = BATCH_SIZE, predicate: ds.Expression | None = None
+) -> Iterator[pa.RecordBatch]:
+	"""
+	Stream a processed dataset (partitioned or not), batch_size rows at a time (generator)
+	"""
+
+	dataset = ds.dataset(path, format="parquet", partitioning="hive" if path.is_dir() else None)
+	return dataset.to_batches(columns=columns, batch_size=batch_size, filter=predicate)
+
+
+def encode_chunk(texts: list[str]) -> list[np.ndarray]:
+	"""
+	Token ids of every document of a chunk, as arrays
+	"""
+
+	# NOTE: Special tokens (e.g., <|endoftext|>) are just text as far as we're concerned
+	return [np.array(TIKTOKEN.encode_ordinary(text), dtype=np.uint32) for text in texts]
+
+
+def encode(texts: list[str], threads: int | None = None) -> pa.LargeListArray:
+	"""
+	Tokenize a batch of documents, straight into an Arrow LargeList[UInt32] array
+	NOTE: 64-bit offsets, as the whole corpus in a single batch (c.f., features.py) is well over 2^31 tokens
+	"""
+
+	# NOTE: Token ids are turned into arrays by the workers, so that this (GIL bound) conversion overlaps
+	#       w/ encoding on the other threads, instead of running on its own afterwards
+	threads = threads or os.cpu_count()
+	size = max(1, -(-len(texts) // (threads * 4)))
+	with ThreadPoolExecutor(max_workers=threads) as executor:
+		chunks = executor.map(encode_chunk, (texts[i : i + size] for i in range(0, len(texts), size)))
+		arrays = list(chain.from_iterable(chunks))
+	offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+	np.cumsum(np.fromiter(map(len, arrays), dtype=np.int64, count=len(arrays)), out=offsets[1:])
+	values = np.concatenate(arrays) if arrays else np.empty(0, dtype=np.uint32)
+	return pa.LargeListArray.from_arrays(pa.array(offsets), pa.array(values))
+
+
+def tokenize(input_path: Path, output_path: Path, batch_size: int = BATCH_SIZE, threads: int | None = None) -> int:
+	"""
+	Dump the token ids of every document to a zstd compressed parquet file, batch_size documents at a time.
+	Returns the amount of documents written.
+	"""
+
+	count = 0
+	with pq.ParquetWriter(output_path, TOKENS_SCHEMA, compression="zstd") as writer:
+		for batch in tqdm(
+			read_batches(input_path, ["title", "semicentury", "quality", "text"], batch_size), unit=" batches"
+		):
+			tokens = encode(batch.column("text").to_pylist(), threads)
+			writer.write_batch(
+				pa.record_batch(
+					[
+						batch.column("title"),
+						batch.column("semicentury").cast(pa.uint16()),
+						batch.column("quality").cast(pa.uint8()),
+						tokens,
+					],
+					schema=TOKENS_SCHEMA,
+				)
+			)
+			count += batch.num_rows
+	return count
+
+
+@app.command()
+def main(
+	input_paths: Annotated[list[Path] | None, typer.Argument()] = None,
+	batch_size: int = BATCH_SIZE,
+	threads: int | None = None,
+) -> None:
+	"""
+	Tokenize processed datasets (train, test & dev by default), next to each of them (e.g., frwikisource-train.tokens.parquet)
+	"""
+
+	for input_path in input_paths or [TRAIN_DATASET, TEST_DATASET, DEV_DATASET]:
+		output_path = tokens_path(input_path)
+		logger.info(f"Tokenizing {input_path}...")
+		count = tokenize(input_path, output_path, batch_size, threads)
+		logger.success(f"Wrote {count} documents to {output_path}")
+
+
+if __name__ == "__main__":
+	app()
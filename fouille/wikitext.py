@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+#
+# Wikitext to plain text conversion, for the subset of markup actually used on Wikisource pages.
+# parse_fast is a single pass converter, parse_wtp is the (much slower) wikitextparser reference implementation,
+# and the validate command compares the two on a sample of pages from the page table (c.f., fouille/ingest.py).
+#
+
+from difflib import SequenceMatcher
+from html import unescape
+from pathlib import Path
+import random
+import re
+import time
+from typing import NamedTuple
+
+from loguru import logger
+import pyarrow.parquet as pq
+import typer
+import wikitextparser as wtp
+
+from fouille.config import RAW_PAGES_DATASET
+
+app = typer.Typer()
+
+PQ_RE = re.compile(r"<pagequality [^>]+/>")
+PQ_LEVEL_RE = re.compile(r"level=\"(\d)\"")
+PAGES_RE = re.compile(r"<pages [^>]+/>")
+PAGES_INDEX_RE = re.compile(r"index=\"([^\"]+)\"")
+CATEGORY_RE = re.compile(r"\[\[(?:catégorie|category):([^|\]#:]*)", re.IGNORECASE)
+
+# Everything parse_fast has to stop for (anything else is copied as-is)
+TOKEN_RE = re.compile(
+	r"<!--"
+	r"|\{\{"
+	r"|\[\["
+	r"|\[(?:https?:|ftp:|mailto:|//)"
+	r"|'{2,}"
+	r"|</?[a-zA-Z][a-zA-Z0-9]*(?:\s[^<>]*)?/?>"
+	r"|^[ \t]*\{\|",
+	re.MULTILINE,
+)
+TAG_RE = re.compile(r"<(/?)([a-zA-Z][a-zA-Z0-9]*)(\s[^<>]*?)?(/?)>")
+BRACES_RE = re.compile(r"\{\{|\}\}")
+BRACKETS_RE = re.compile(r"\[\[|\]\]")
+TABLE_RE = re.compile(r"^[ \t]*(\{\||\|\})", re.MULTILINE)
+CELLS_RE = re.compile(r"\|\||!!")
+
+# Tags whose contents are *not* wikitext (and how to find where they end)
+VERBATIM_TAGS = {name: re.compile(rf"</{name}\s*>", re.IGNORECASE) for name in ("nowiki", "pre")}
+# Links to these are images (or other media), which don't end up in the text
+FILE_EXTENSIONS = {
+	"djvu",
+	"gif",
+	"jpeg",
+	"jpg",
+	"mp3",
+	"oga",
+	"ogg",
+	"ogv",
+	"pdf",
+	"png",
+	"svg",
+	"tif",
+	"tiff",
+	"webm",
+	"webp",
+}
+
+
+class ParsedPage(NamedTuple):
+	"""
+	Everything data/extract_data.py needs to know about a page's wikitext
+	"""
+
+	text: str
+	categories: set[str]
+	# Raw value of the (last) TextQuality template (e.g., "75%" or "Textes validés")
+	text_quality: str | None
+	# Level (0 to 4) of the (first) pagequality element
+	page_quality: int | None
+	# Book references, from pages elements (index attribute) & Page templates (first argument)
+	embeds: list[str]
+
+
+def parse_wtp(text: str) -> ParsedPage:
+	"""
+	Reference implementation, via wikitextparser's plain_text
+	"""
+
+	parsed = wtp.parse(text)
+
+	# Convert to plain text
+	# NOTE: This may be a *tad* aggressive... ;'(
+	text = parsed.plain_text()
+
+	categories = set()
+	# Check links for Categories
+	for link in parsed.wikilinks:
+		elts = link.title.split(":")
+		if len(elts) < 2:
+			continue
+
+		key, value = elts[0], elts[1]
+		ci_key = key.lower()
+		if ci_key == "catégorie" or ci_key == "category":
+			value = value.strip()
+			if value:
+				categories.add(value)
+
+		# Drop the links from the actual text. This is obviously particularly critical for the categories, lol ;).
+		# NOTE: This rescans (and copies) the whole text for every link, c.f., parse_fast.
+		text = text.replace(f"{key}:{value}", "")
+
+	text_quality = None
+	embeds = []
+	for template in parsed.templates:
+		key = template.name.lower()
+		if key == "textquality":
+			text_quality = template.arguments[0].value
+		elif key == "page" and template.arguments:
+			embeds.append(template.arguments[0].value)
+
+	page_quality = None
+	m = PQ_RE.search(parsed.string)
+	if m:
+		m = PQ_LEVEL_RE.search(m.group(0))
+		if m:
+			page_quality = int(m.group(1))
+
+	for m in PAGES_RE.finditer(parsed.string):
+		m = PAGES_INDEX_RE.search(m.group(0))
+		if m:
+			embeds.append(m.group(1))
+
+	return ParsedPage(text, categories, text_quality, page_quality, embeds)
+
+
+class _State:
+	"""
+	What parse_fast picks up along the way
+	"""
+
+	__slots__ = ("categories", "text_quality", "page_quality", "embeds")
+
+	def __init__(self) -> None:
+		self.categories = set()
+		self.text_quality = None
+		self.page_quality = None
+		self.embeds = []
+
+
+class _Closers:
+	"""
+	Where the constructs opened in a given text end
+	NOTE: Openers are paired up w/ their closers in a single pass (per kind), and searches pick up where the last one
+	      stopped, so that unclosed openers don't each rescan the rest of the text (which made malformed pages quadratic)
+	"""
+
+	__slots__ = ("text", "pairs", "found")
+
+	def __init__(self, text: str) -> None:
+		self.text = text
+		self.pairs = {}
+		self.found = {}
+
+	def match(self, start: int, pair_re: re.Pattern) -> int:
+		"""
+		Return the end of the (nested) construct opened at start, or -1 if it's never closed
+		"""
+
+		pairs = self.pairs.setdefault(pair_re, {})
+		if start not in pairs:
+			# NOTE: Every opener met along the way gets resolved too, so this only ever runs again for an opener
+			#       that's out of step w/ this scan (e.g., halfway through a run of braces)
+			stack = []
+			for m in pair_re.finditer(self.text, start):
+				if m.group(0).lstrip()[0] in "{[":
+					stack.append(m.start())
+				elif stack:
+					pairs[stack.pop()] = m.end()
+			for opener in stack:
+				pairs[opener] = -1
+		return pairs[start]
+
+	def find(self, needle: str | re.Pattern, start: int) -> int:
+		"""
+		Return the position of the first needle (a string, or a pattern) at or after start, or -1 if there's none
+		"""
+
+		# NOTE: The last search still holds if it started before start, and found nothing up until start
+		searched, found = self.found.get(needle, (None, None))
+		if searched is None or start < searched or start > found != -1:
+			if isinstance(needle, str):
+				found = self.text.find(needle, start)
+			else:
+				m = needle.search(self.text, start)
+				found = m.start() if m else -1
+			self.found[needle] = (start, found)
+		return found
+
+
+def _first_argument(args: str) -> str:
+	"""
+	Value of the first argument of a template, named or not
+	"""
+
+	arg = args.partition("|")[0]
+	_, eq, value = arg.partition("=")
+	return value if eq else arg
+
+
+def _template(body: str, state: _State) -> None:
+	"""
+	Templates don't make it to the text, but a couple of them are of interest to us
+	"""
+
+	name, _, args = body.partition("|")
+	key = name.lower()
+	if key == "textquality":
+		state.text_quality = _first_argument(args)
+	elif key == "page" and args:
+		state.embeds.append(_first_argument(args))
+
+	# wikitextparser also picks up links nested in templates
+	if "[[" in args:
+		for m in CATEGORY_RE.finditer(args):
+			value = m.group(1).strip()
+			if value:
+				state.categories.add(value)
+
+	# ... and templates nested in templates (e.g., {{Centré|{{TextQuality|75%}}}}), in order
+	closers = _Closers(args)
+	pos = 0
+	while (start := args.find("{{", pos)) != -1:
+		if args.startswith("{{{", start):
+			# Template parameter, look inside it (i.e., its default value)
+			pos = start + 3
+			continue
+		close = closers.match(start, BRACES_RE)
+		if close == -1:
+			break
+		_template(args[start + 2 : close - 2], state)
+		pos = close
+
+
+def _wikilink(inner: str, state: _State) -> str:
+	"""
+	Categories & images are dropped, other links are replaced by their text (or their target)
+	"""
+
+	target, pipe, label = inner.partition("|")
+	title = target.partition("#")[0]
+	key, colon, rest = title.partition(":")
+	if colon:
+		if key.lower() in ("catégorie", "category"):
+			value = rest.partition(":")[0].strip()
+			if value:
+				state.categories.add(value)
+			return ""
+		if title[:1] != ":" and rest.rpartition(".")[2] in FILE_EXTENSIONS:
+			return ""
+
+	if pipe:
+		return _convert(label, state)
+	# NOTE: Namespaced (or interwiki) links w/o a label used to be stripped from the text after the fact, so, same.
+	return "" if colon else target
+
+
+def _table(table: str, state: _State) -> str:
+	"""
+	Lay a table out as tab separated cells, one row per line
+	"""
+
+	caption = None
+	rows = [[]]
+	# Skip the opening & closing lines
+	for line in table.splitlines()[1:-1]:
+		line = line.strip()
+		if line.startswith("|-"):
+			rows.append([])
+		elif line.startswith("|+"):
+			caption = _convert(line[2:].strip(), state)
+		elif line[:1] in ("|", "!"):
+			for cell in CELLS_RE.split(line[1:]):
+				# Drop cell attributes (e.g., | style="..." | content)
+				attrs, bar, content = cell.partition("|")
+				if bar and "[[" not in attrs and "{{" not in attrs:
+					cell = content
+				rows[-1].append(_convert(cell.strip(), state))
+		elif rows[-1]:
+			rows[-1][-1] += "\n" + _convert(line, state)
+
+	rows = [row for row in rows if row]
+	if not rows:
+		return ""
+	return (f"\n{caption}\n" if caption is not None else "") + "\n" + "\n".join("\t".join(row) for row in rows) + "\n"
+
+
+def _convert(text: str, state: _State) -> str:
+	"""
+	Strip markup from text in a single left to right pass (recursing into link labels & table cells)
+	"""
+
+	out = []
+	pos = 0
+	end = len(text)
+	closers = _Closers(text)
+	while m := TOKEN_RE.search(text, pos):
+		start = m.start()
+		out.append(text[pos:start])
+		token = m.group(0)
+		pos = m.end()
+
+		if token == "<!--":
+			close = closers.find("-->", pos)
+			pos = end if close == -1 else close + 3
+		elif token == "{{":
+			close = closers.match(start, BRACES_RE)
+			if close == -1:
+				out.append(token)
+				continue
+
+			if text.startswith("{{{", start):
+				# Template parameter, keep its default value (if any)
+				if close < end and text[close] == "}":
+					close += 1
+				_, bar, default = text[start + 3 : close - 3].partition("|")
+				if bar:
+					out.append(_convert(default, state))
+			else:
+				_template(text[start + 2 : close - 2], state)
+			pos = close
+		elif token == "[[":
+			close = closers.match(start, BRACKETS_RE)
+			if close == -1:
+				out.append(token)
+				continue
+
+			out.append(_wikilink(text[start + 2 : close - 2], state))
+			pos = close
+		elif token[0] == "[":
+			# External link: keep the label (if any), drop the URL
+			close = closers.find("]", start)
+			if close == -1 or -1 < closers.find("\n", start) < close:
+				out.append(token)
+				continue
+
+			_, space, label = text[start + 1 : close].partition(" ")
+			if space:
+				out.append(_convert(label, state))
+			pos = close + 1
+		elif token[0] == "'":
+			# Bold & italics (c.f., how MediaWiki handles apostrophe runs)
+			if len(token) == 4:
+				out.append("'")
+			elif len(token) > 5:
+				out.append("'" * (len(token) - 5))
+		elif token[0] == "<":
+			# Tags are dropped, their contents are kept
+			tag = TAG_RE.match(token)
+			closing, name, attrs, self_closing = tag.groups()
+			if closing:
+				continue
+
+			name = name.lower()
+			if name == "pagequality":
+				level = PQ_LEVEL_RE.search(attrs or "")
+				if level and state.page_quality is None:
+					state.page_quality = int(level.group(1))
+			elif name == "pages":
+				index = PAGES_INDEX_RE.search(attrs or "")
+				if index:
+					state.embeds.append(index.group(1))
+			elif name in VERBATIM_TAGS and not self_closing:
+				close = closers.find(VERBATIM_TAGS[name], pos)
+				if close != -1:
+					out.append(text[pos:close])
+					pos = VERBATIM_TAGS[name].match(text, close).end()
+		else:
+			close = closers.match(start, TABLE_RE)
+			if close == -1:
+				out.append(token)
+				continue
+
+			out.append(_table(text[start:close], state))
+			pos = close
+
+	out.append(text[pos:])
+	return "".join(out)
+
+
+def parse_fast(text: str) -> ParsedPage:
+	"""
+	Single pass conversion to plain text, picking up categories, quality & embeds along the way
+	"""
+
+	state = _State()
+	try:
+		text = unescape(_convert(text, state))
+	except RecursionError:
+		# NOTE: Markup nested a thousand levels deep is bogus anyway, let wikitextparser deal w/ it
+		return parse_wtp(text)
+	return ParsedPage(text, state.categories, state.text_quality, state.page_quality, state.embeds)
+
+
+def sample_pages(input_path: Path, size: int, seed: int) -> list[dict]:
+	"""
+	Pull a random sample of wikitext pages from the page table, w/o reading the whole thing
+	"""
+
+	rng = random.Random(seed)
+	pf = pq.ParquetFile(input_path)
+	row_groups = list(range(pf.num_row_groups))
+	rng.shuffle(row_groups)
+
+	pages = []
+	per_group = max(1, size // max(1, len(row_groups) // 4))
+	for i in row_groups:
+		rows = [
+			row
+			for row in pf.read_row_group(i, columns=["title", "format", "text"]).to_pylist()
+			if row["format"] == "text/x-wiki" and row["text"]
+		]
+		pages.extend(rng.sample(rows, min(per_group, len(rows))))
+		if len(pages) >= size:
+			break
+	return pages[:size]
+
+
+def normalize(text: str) -> str:
+	"""
+	Collapse whitespace (tables & line breaks are laid out slightly differently)
+	"""
+
+	return " ".join(text.split())
+
+
+@app.command()
+def validate(input_path: Path = RAW_PAGES_DATASET, sample: int = 1000, seed: int = 42) -> None:
+	"""
+	Check parse_fast against the wikitextparser reference on a sample of pages
+	"""
+
+	logger.info(f"Sampling {sample} pages from {input_path}...")
+	pages = sample_pages(input_path, sample, seed)
+
+	timings = {}
+	results = {}
+	for name, parse in (("wtp", parse_wtp), ("fast", parse_fast)):
+		start = time.perf_counter()
+		results[name] = [parse(page["text"]) for page in pages]
+		timings[name] = time.perf_counter() - start
+
+	counts = dict.fromkeys(("text", "normalized", "categories", "text_quality", "page_quality", "embeds"), 0)
+	similarity = 0.0
+	for page, ref, fast in zip(pages, results["wtp"], results["fast"]):
+		counts["text"] += ref.text == fast.text
+		counts["normalized"] += normalize(ref.text) == normalize(fast.text)
+		counts["categories"] += ref.categories == fast.categories
+		counts["text_quality"] += ref.text_quality == fast.text_quality
+		counts["page_quality"] += ref.page_quality == fast.page_quality
+		counts["embeds"] += sorted(ref.embeds) == sorted(fast.embeds)
+		# Word level, so this stays tractable on large pages
+		similarity += SequenceMatcher(None, ref.text.split(), fast.text.split()).ratio()
+		if normalize(ref.text) != normalize(fast.text):
+			logger.debug(f"Text mismatch on {page['title']}")
+
+	for key, count in counts.items():
+		logger.info(f"{key}: {count / len(pages):.2%} identical")
+	logger.info(f"Mean word-level similarity: {similarity / len(pages):.4f}")
+	logger.info(f"wtp: {timings['wtp']:.2f}s, fast: {timings['fast']:.2f}s ({timings['wtp'] / timings['fast']:.1f}x)")
+
+
+if __name__ == "__main__":
+	app()
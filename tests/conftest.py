@@ -0,0 +1,20 @@
+import importlib.util
+from pathlib import Path
+import sys
+
+import pytest
+
+DATA_DIR = Path(__file__).parent.parent / "data"
+
+
+@pytest.fixture(scope="session")
+def extract_data():
+	"""
+	data/extract_data.py is a script, not a module of the package
+	"""
+
+	spec = importlib.util.spec_from_file_location("extract_data", DATA_DIR / "extract_data.py")
+	module = importlib.util.module_from_spec(spec)
+	sys.modules["extract_data"] = module
+	spec.loader.exec_module(module)
+	return module
@@ -0,0 +1,35 @@
+from fouille.wikitext import parse_wtp
+
+BODY = "Il était une fois une page bien trop longue pour être une table des matières. " * 8
+COMMENTED_PAGE = f"<!-- {{{{Page|Un livre.djvu|num=12}}}} -->\n{{{{TextQuality|75%}}}}\n{BODY}\n[[Catégorie:Romans]]\n"
+
+
+def page(title: str, text: str) -> dict:
+	return {"title": title, "format": "text/x-wiki", "text": text, "revision_id": 1, "sha1": "0"}
+
+
+def test_commented_page_template_is_ignored(extract_data):
+	assert extract_data.classify_page("Un texte", COMMENTED_PAGE) == extract_data.ROUTE_TEXT
+	data = extract_data.page_extract(page("Un texte", COMMENTED_PAGE))
+	pages, records = extract_data.parse_chunk([data], "fast")
+	assert [p["title"] for p in pages] == ["Un texte"]
+	assert pages[0]["quality"] == 75
+	assert pages[0]["categories"] == parse_wtp(COMMENTED_PAGE).categories
+	assert records[0]["book_categories"] == []
+
+
+def test_missing_page_template_falls_back_to_text(extract_data):
+	data = {**page("Un texte", COMMENTED_PAGE), "route": extract_data.ROUTE_PAGE_TEMPLATE}
+	book_categories = {}
+	parsed = extract_data.parse_page(data, book_categories, "fast")
+	assert parsed is not None and parsed["quality"] == 75
+	assert not book_categories
+
+
+def test_page_template_contributes_categories(extract_data):
+	text = "{{Page|Un livre.djvu|num=12}}\n[[Catégorie:Romans]]\n"
+	data = extract_data.page_extract(page("Un texte", text))
+	assert data["route"] == extract_data.ROUTE_PAGE_TEMPLATE
+	pages, records = extract_data.parse_chunk([data], "fast")
+	assert not pages
+	assert records[0]["book_categories"] == [{"book_title": "Un livre.djvu", "categories": ["Romans"]}]
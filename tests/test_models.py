@@ -0,0 +1,45 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+pytest.importorskip("tiktoken")
+
+from fouille.modeling.models import LABELS, shard_batches, train_streaming  # noqa: E402
+
+
+@pytest.fixture
+def partitioned_shards(tmp_path):
+	"""
+	Feature shards as transform writes them from a partitioned dataset: one shard (i.e., one class) per partition
+	"""
+
+	rng = np.random.default_rng(0)
+	labels = []
+	for i, label in enumerate(LABELS):
+		X = rng.poisson(1.0, size=(64, 2 * len(LABELS))).astype(np.float64)
+		X[:, i] += 2
+		sparse.save_npz(tmp_path / f"{i:05}.npz", sparse.csr_matrix(X))
+		labels += [label] * len(X)
+	pq.write_table(pa.table({"semicentury": pa.array(labels, pa.int64())}), tmp_path / "rows.parquet")
+	return tmp_path, sparse.vstack([sparse.load_npz(tmp_path / f"{i:05}.npz") for i in range(len(LABELS))]), labels
+
+
+def test_shuffled_batches_mix_shards(partitioned_shards):
+	path, _, labels = partitioned_shards
+	batches = list(shard_batches(path, np.random.default_rng(0)))
+	assert sum(len(y) for _, y in batches) == len(labels)
+	assert all(len(np.unique(y)) > 1 for _, y in batches)
+
+
+@pytest.mark.parametrize("key", ["sgd_svm", "sgd_logreg"])
+def test_streaming_learns_from_single_class_shards(partitioned_shards, key):
+	path, X, labels = partitioned_shards
+	X, y = normalize(X), np.array(labels)
+	model = train_streaming(key, path, epochs=5, seed=42)
+	# Same model, fitted on globally shuffled rows
+	rows = np.random.default_rng(1).permutation(len(y))
+	reference = model.__class__(**model.get_params()).set_params(max_iter=5, tol=None).fit(X[rows], y[rows])
+	assert (model.predict(X) == y).mean() > (reference.predict(X) == y).mean() - 0.05
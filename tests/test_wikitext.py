@@ -0,0 +1,34 @@
+from time import perf_counter
+
+import pytest
+
+from fouille.wikitext import parse_fast, parse_wtp
+
+
+@pytest.mark.parametrize("opener", ["{{", "[[", "\n{|", "[http://example.org ", "<nowiki>"])
+def test_unclosed_openers_stay_linear(opener):
+	text = ("Lorem ipsum " + opener) * 5000 + "\n[[Catégorie:Romans]]"
+	start = perf_counter()
+	parsed = parse_fast(text)
+	# NOTE: Rescanning the rest of the page for every opener took several seconds
+	assert perf_counter() - start < 1.0
+	if opener != "<nowiki>":
+		assert parsed.categories == {"Romans"}
+
+
+def test_unclosed_openers_match_wtp():
+	text = "{{TextQuality|75%}}\nUn {{ deux [[ trois {|\n quatre [[Catégorie:Romans]] {{Page|Livre.djvu}}"
+	fast, ref = parse_fast(text), parse_wtp(text)
+	assert fast.categories == ref.categories
+	assert fast.text_quality == ref.text_quality
+
+
+def test_nested_templates():
+	parsed = parse_fast("{{Centré|{{TextQuality|75%}}}}{{a|{{{1|{{b|[[Catégorie:Romans]]}}}}}}}")
+	assert parsed.text_quality == "75%"
+	assert parsed.categories == {"Romans"}
+
+
+def test_deeply_nested_markup_does_not_crash():
+	text = "{{a|" * 1200 + "}}" * 1200 + "[[Catégorie:Romans]]"
+	assert parse_fast(text).categories == {"Romans"}